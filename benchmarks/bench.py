@@ -0,0 +1,195 @@
+"""
+Time each phase of the conversion on synthetic CRS files.
+
+    python benchmarks/bench.py --sizes 10000 100000 1000000 --output benchmarks/results/current.json
+    python benchmarks/bench.py --compare benchmarks/results/before.json benchmarks/results/current.json
+
+Each input is generated in one process and converted in another, so peak memory is measured per size
+and covers the conversion only.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_crs  # noqa: E402
+from crs_to_xml.builder import build_activity  # noqa: E402
+from crs_to_xml.convert import ALIASES  # noqa: E402
+from crs_to_xml.countries import CountryResolver  # noqa: E402
+from crs_to_xml.grouping import group_split, stream_activities  # noqa: E402
+from crs_to_xml.instrument import peak_rss_mb  # noqa: E402
+from crs_to_xml.normalize import SOURCE_COLUMNS, normalize  # noqa: E402
+from crs_to_xml.readers import read_chunks, read_ids  # noqa: E402
+from crs_to_xml.writer import COMPRESSIONS, ActivityWriter, open_output, serialize_activity  # noqa: E402
+
+# zip is the time spent writing and compressing the output, counted apart from serialize.
+PHASES = ['read', 'group', 'build', 'serialize', 'zip']
+
+
+def generate_input(rows, transactions, fileformat, workdir):
+    """
+    Write one synthetic file.
+    :param rows: Number of source rows.
+    :param transactions: Average rows per activity.
+    :param fileformat: 'csv' or 'xlsx'.
+    :param workdir: Directory for the generated input.
+    :return source: Path to the file.
+    """
+    source = os.path.join(workdir, 'crs-{0}.{1}'.format(rows, fileformat))
+    generate_crs.write(generate_crs.generate(rows, max(1, rows // transactions)), source)
+    return source
+
+
+def run_size(source, rows, fileformat, workdir, compression='zip'):
+    """
+    Time every phase of converting one synthetic file.
+    :param source: The file, see generate_input.
+    :param rows: Number of source rows.
+    :param fileformat: 'csv' or 'xlsx'.
+    :param workdir: Directory for the output.
+    :param compression: The output compression, see writer.COMPRESSIONS.
+    :return result: Dictionary of phase timings in seconds, counts and peak memory.
+    """
+    timings = dict.fromkeys(PHASES, 0.0)
+
+    def timed_chunks():
+        # Reading is timed while the conversion pulls chunks, so memory stays as in a real run.
+        resolver = CountryResolver(ALIASES)
+        chunks = read_chunks(source, SOURCE_COLUMNS)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            if chunk is None:
+                timings['read'] += time.perf_counter() - start
+                return
+            crscolumns = normalize(chunk)
+            crscolumns["recipient_code"] = resolver.resolve_column(crscolumns["recipient_country"])
+            timings['read'] += time.perf_counter() - start
+            yield crscolumns
+
+    start = time.perf_counter()
+    crsids = read_ids(source)
+    timings['read'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    crsgrouping = group_split(crsids)
+    timings['group'] = time.perf_counter() - start
+
+    output = os.path.join(workdir, 'crs-{0}.xml'.format(rows))
+    with open_output(output, compression) as output_file:
+        activities = ActivityWriter(output_file, 'iati-activities', {'version': '2.03'})
+        for activityid, crscolumns, activityRows in stream_activities(crsgrouping, timed_chunks()):
+            start = time.perf_counter()
+            activity = build_activity(crscolumns, activityid, activityRows, '2018-01-01T00:00:00.000Z')
+            middle = time.perf_counter()
+            fragment = serialize_activity(activity)
+            end = time.perf_counter()
+            activities.write_fragment(fragment)
+            timings['build'] += middle - start
+            timings['serialize'] += end - middle
+            timings['zip'] += time.perf_counter() - end
+        activities.close()
+        start = time.perf_counter()
+    timings['zip'] += time.perf_counter() - start
+
+    return {
+        'rows': rows,
+        'activities': len(crsgrouping.ids),
+        'format': fileformat,
+        'compression': compression,
+        'seconds': timings,
+        'total_seconds': sum(timings.values()),
+        'output_bytes': os.path.getsize(output + COMPRESSIONS[compression]),
+        # None where the platform does not report it.
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _generate_input(arguments):
+    """
+    Pool entry point for generate_input.
+    """
+    return generate_input(*arguments)
+
+
+def _run_size(arguments):
+    """
+    Pool entry point for run_size.
+    """
+    return run_size(*arguments)
+
+
+def compare(before, after):
+    """
+    Print the change of every phase between two result files.
+    :param before: Path to the older results.
+    :param after: Path to the newer results.
+    """
+    with open(before, encoding='utf-8') as beforefile, open(after, encoding='utf-8') as afterfile:
+        old = {result['rows']: result for result in json.load(beforefile)['results']}
+        new = {result['rows']: result for result in json.load(afterfile)['results']}
+    for rows in sorted(set(old) & set(new)):
+        print('{0} rows'.format(rows))
+        for phase in PHASES + ['total']:
+            if phase == 'total':
+                was, now = old[rows]['total_seconds'], new[rows]['total_seconds']
+            else:
+                was, now = old[rows]['seconds'][phase], new[rows]['seconds'][phase]
+            change = (now - was) / was if was else 0
+            print('  {0:<10} {1:9.3f}s -> {2:9.3f}s  {3:+7.1%}'.format(phase, was, now, change))
+        was, now = old[rows].get('peak_rss_mb'), new[rows].get('peak_rss_mb')
+        if was is None or now is None:
+            continue
+        print('  {0:<10} {1:8.1f}MB -> {2:8.1f}MB {3:+7.1%}'.format('peak', was, now, (now - was) / was if was else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the CRS to XML conversion phases.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='Row counts')
+    parser.add_argument('--transactions', type=int, default=3, help='Average rows per activity')
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv', help='Synthetic input format')
+    parser.add_argument('--compression', choices=sorted(COMPRESSIONS), default='zip', help='Output compression')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--label', default='', help='Free text stored with the results, such as a version')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.sizes:
+            # A fresh process to generate the input and another to convert it, so peak memory is neither
+            # carried over between sizes nor taken up by the generator.
+            with multiprocessing.Pool(1) as pool:
+                source = pool.map(_generate_input, [(rows, args.transactions, args.format, workdir)])[0]
+            with multiprocessing.Pool(1) as pool:
+                result = pool.map(_run_size, [(source, rows, args.format, workdir, args.compression)])[0]
+            results.append(result)
+            timings = '  '.join('{0} {1:.3f}s'.format(phase, result['seconds'][phase]) for phase in PHASES)
+            peak = '  peak {0:.0f}MB'.format(result['peak_rss_mb']) if result['peak_rss_mb'] is not None else ''
+            print('{0:>9} rows  {1}{2}'.format(rows, timings, peak))
+
+    report = {
+        'label': args.label,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
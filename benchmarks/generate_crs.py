@@ -0,0 +1,152 @@
+"""
+Generate a synthetic CRS file with every column the converter reads.
+
+    python benchmarks/generate_crs.py crs/synthetic.csv --rows 100000 --activities 30000
+"""
+import argparse
+
+import numpy
+import pandas
+
+RECIPIENTS = ['Afghanistan', 'Bangladesh', 'Bolivia', 'Colombia', 'Congo, Dem. Rep.', 'Egypt', 'Ethiopia',
+              'Ghana', 'Guatemala', 'Haiti', 'India', 'Indonesia', 'Jordan', 'Kenya', 'Liberia', 'Malawi',
+              'Mozambique', 'Nepal', 'Nigeria', 'Pakistan', 'Peru', 'Philippines', 'Rwanda', 'Senegal',
+              'Somalia', 'South Sudan', 'Tanzania', 'Uganda', 'Ukraine', 'Viet Nam', 'West Bank and Gaza Strip',
+              'Yemen', 'Zambia', 'Zimbabwe', 'Bilateral, unspecified', 'South of Sahara, regional',
+              'America, regional', 'Asia, regional']
+PURPOSES = [11220, 12220, 12240, 12262, 13020, 13030, 14030, 15110, 15150, 16010, 23210, 31120, 31161,
+            41010, 43040, 72010, 72040, 74010]
+AID_TYPES = ['A01', 'A02', 'B01', 'B03', 'C01', 'D01', 'D02', 'E01', 'H01']
+MARKERS = ['gender_equity', 'aid_to_environment', 'pd_GG', 'Trade_Development', 'biodiversity', 'mitigation',
+           'adaptation', 'desertification', 'RMNCH']
+FLAGS = ['FTC', 'Programme_based_approach', 'investment_project', 'AF']
+
+
+def generate(rows, activities, nulls=0.3, scattered=False, seed=0):
+    """
+    Return a synthetic CRS table.
+    :param rows: Number of rows (transactions).
+    :param activities: Number of distinct activities; each gets rows // activities transactions on average.
+    :param nulls: Share of empty cells in the optional columns.
+    :param scattered: Spread each activity's rows across the file instead of keeping them together.
+    :param seed: Random seed, so the same arguments give the same file.
+    :return crs: The DataFrame.
+    """
+    generator = numpy.random.default_rng(seed)
+    activities = max(1, min(activities, rows))
+    if scattered:
+        activity = generator.integers(0, activities, rows)
+    else:
+        activity = numpy.sort(generator.integers(0, activities, rows))
+    # Every activity appears at least once.
+    activity[generator.permutation(rows)[:activities]] = numpy.arange(activities)
+    if not scattered:
+        activity.sort()
+
+    def optional(values, share=nulls):
+        series = pandas.Series(values)
+        return series.mask(generator.random(rows) < share)
+
+    def amounts(share=nulls, high=5e6):
+        return optional(numpy.round(generator.lognormal(10, 2, rows).clip(1, high), 2), share)
+
+    def codes(low, high, share=nulls):
+        return optional(generator.integers(low, high + 1, rows), share).astype('Int64')
+
+    def dates(start, days, share=nulls):
+        offsets = pandas.to_timedelta(generator.integers(0, days, rows), unit='D')
+        return optional(pandas.Timestamp(start) + offsets, share)
+
+    def choice(values, share=nulls):
+        return optional(numpy.asarray(values, dtype=object)[generator.integers(0, len(values), rows)], share)
+
+    year = generator.integers(2014, 2020, rows)
+    loans = generator.random(rows) < 0.15
+    crs = pandas.DataFrame({
+        'crs_id_number': pandas.Series(activity + 2014000001).map('{0:010d}'.format),
+        'usaid_award_number': optional(pandas.Series(activity).map('AID-{0:06d}'.format), 0.2),
+        'project_title': pandas.Series(activity).map('Synthetic project {0}'.format),
+        'description': optional(pandas.Series(activity).map('Description of synthetic project {0}.'.format), 0.1),
+        'start_date': dates('2012-01-01', 2500, 0.1),
+        'completion_date': dates('2018-01-01', 2500, 0.2),
+        'geographical_target': choice(['Nationwide', 'Northern region', 'Capital district', 'Coastal areas']),
+        'recipient_country': choice(RECIPIENTS, 0.01),
+        'purpose_code': choice(PURPOSES, 0.02),
+        'bi_multi': codes(1, 4, 0.05),
+        'flow_type': codes(10, 14, 0.05),
+        'finance_type': choice([110, 410, 421], 0.05),
+        'dac_typology': choice(AID_TYPES, 0.05),
+        'amt_extended': amounts(),
+        'commitments': amounts(),
+        'amt_received': amounts(0.9),
+        'interest_received': amounts(0.9),
+        'amt_untied': amounts(),
+        'amt_partial': amounts(0.8),
+        'amt_tied': amounts(0.8),
+        'reporting_year': pandas.Series(year),
+        'commitment_date': dates('2014-01-01', 2000, 0.2),
+        'grant_equivalent': amounts(0.5),
+        'channel_code': choice([11000, 12000, 21000, 22000, 41000, 51000, 61000], 0.1),
+        'channel_name': choice(['Donor Government', 'Recipient Government', 'International NGO',
+                                'Donor country-based NGO', 'Multilateral organisation'], 0.2),
+        'reporting_country': pandas.Series(numpy.full(rows, 302)),
+        'extending_agency': codes(1, 30, 0.05),
+        'nature_of_submission': codes(1, 8, 0.05),
+        'currency': pandas.Series(numpy.full(rows, 302)),
+        'irtc': amounts(0.95),
+        'expert_commitment': amounts(0.95),
+        'expert_extended': amounts(0.95),
+        'export_credit': amounts(0.98),
+        'Leverage_mech': codes(1, 7, 0.95),
+        'Orgin_of_funds': codes(1, 3, 0.95),
+        'Amounts_mobilized': amounts(0.95),
+    })
+    for marker in MARKERS:
+        crs[marker] = codes(0, 2)
+    for flag in FLAGS:
+        crs[flag] = codes(0, 1)
+
+    # Loan terms only on loan rows.
+    crs['Interest_rate'] = optional(numpy.round(generator.uniform(0, 5, rows), 2), 0).where(loans)
+    crs['Second_interest_rate'] = optional(numpy.round(generator.uniform(0, 5, rows), 2), 0.5).where(loans)
+    crs['Type'] = codes(1, 5, 0).where(loans)
+    crs['No_repayments'] = codes(1, 4, 0).where(loans)
+    crs['First_repay_date'] = dates('2019-01-01', 1000, 0).where(loans)
+    crs['Final_repay_date'] = dates('2029-01-01', 3000, 0).where(loans)
+    crs['Principa_disbursed'] = amounts(0).where(loans)
+    crs['Principal_arrears'] = amounts(0.8).where(loans)
+    crs['arrears_interest'] = amounts(0.8).where(loans)
+    return crs
+
+
+def write(crs, output):
+    """
+    Write the synthetic table as .xlsx, .csv or .tsv, chosen by the file extension.
+    :param crs: The DataFrame.
+    :param output: The output path.
+    """
+    if output.lower().endswith(('.xlsx', '.xlsm')):
+        crs.to_excel(output, index=False)
+    elif output.lower().endswith('.tsv'):
+        crs.to_csv(output, index=False, sep='\t')
+    else:
+        crs.to_csv(output, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic CRS file.')
+    parser.add_argument('output', help='Output file, .xlsx, .csv or .tsv')
+    parser.add_argument('--rows', type=int, default=10000, help='Number of rows')
+    parser.add_argument('--activities', type=int, help='Number of activities (default rows / transactions)')
+    parser.add_argument('--transactions', type=int, default=3, help='Average transactions per activity')
+    parser.add_argument('--nulls', type=float, default=0.3, help='Share of empty cells in optional columns')
+    parser.add_argument('--scattered', action='store_true', help="Spread each activity's rows across the file")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    activities = args.activities or max(1, args.rows // args.transactions)
+    write(generate(args.rows, activities, args.nulls, args.scattered, args.seed), args.output)
+
+
+if __name__ == '__main__':
+    main()
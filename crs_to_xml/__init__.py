@@ -0,0 +1,16 @@
+"""
+Convert CRS files to IATI XML.
+
+    from crs_to_xml import convert
+    convert('crs/new_crs1.xlsx', 'export', {'compression': 'gzip'})
+
+pandas and the other heavy dependencies are only imported once a file is converted.
+"""
+__author__ = "Timothy Cameron"
+__email__ = "tcameron@devtechsys.com"
+__date__ = "09-06-2018"
+__version__ = "0.1"
+
+from .convert import Converter, Options, convert  # noqa: E402
+
+__all__ = ['Converter', 'Options', 'convert']
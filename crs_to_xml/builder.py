@@ -0,0 +1,246 @@
+from xml.etree.ElementTree import Element, SubElement
+
+from .mapping import ACTIVITY_FIELDS, CRS_ADD_FIELDS, FLAG_FIELDS, OTHER_AMOUNT_FIELDS, any_value, compile_fields
+
+# Compiled once, see mapping.compile_fields.
+emit_activity_fields = compile_fields(ACTIVITY_FIELDS)
+emit_flags = compile_fields(FLAG_FIELDS, reduce='first')
+emit_crs_add_fields = compile_fields(CRS_ADD_FIELDS, reduce='first')
+emit_other_amounts = compile_fields(OTHER_AMOUNT_FIELDS)
+
+# crs-add is only written for activities with at least one of these.
+FLAG_COLUMNS = [spec.column for spec in FLAG_FIELDS]
+
+
+def build_activity(crscolumns, activityid, activityRows, date):
+    """
+    Build the iati-activity element for one activity.
+    :param crscolumns: Normalized columns, see normalize.normalize, plus the resolved "recipient_code" column.
+    :param activityid: The activity identifier.
+    :param activityRows: Positions of the activity's rows in crscolumns, in source order.
+    :param date: The timestamp for last-updated-datetime.
+    :return activity: The iati-activity element.
+    """
+    baseLine = activityRows[0]
+
+    activity = Element('iati-activity', {'last-updated-datetime': date, 'xml:lang': 'en', 'hierarchy': '1'})
+
+    # A2 is the CRS type
+    SubElement(activity, 'other-identifier', ref=activityid, type='A2')
+
+    title = crscolumns["project_title"][baseLine]
+    description = crscolumns["description"][baseLine]
+
+    if title is not None:
+        awardtitle = SubElement(activity, 'title')
+        narrative = SubElement(awardtitle, 'narrative')
+        narrative.text = title
+    if description is not None:
+        awarddescription = SubElement(activity, 'description')
+        narrative = SubElement(awarddescription, 'narrative')
+        narrative.text = description
+
+    startDate = crscolumns["start_date"][baseLine]
+    endDate = crscolumns["completion_date"][baseLine]
+
+    if startDate is not None:
+        SubElement(activity, 'activity-date', {'type': '1', 'iso-date': startDate})
+    if endDate is not None:
+        SubElement(activity, 'activity-date', {'type': '3', 'iso-date': endDate})
+
+    # location
+    loc = crscolumns["geographical_target"][baseLine]
+    if loc is not None:
+        location = SubElement(activity, 'location')
+        locationname = SubElement(location, 'name')
+        narrative = SubElement(locationname, 'narrative')
+        narrative.text = loc
+
+    # policy-marker code=1-9, collaboration-type, default-flow-type, default-finance-type, default-aid-type
+    emit_activity_fields(activity, crscolumns, baseLine)
+
+    # default-aid-type (?)
+    # capital-spend (not applicable)
+
+    for trans in activityRows:
+
+        # try:
+        #    usaidaward = str(crsfile["usaid_award_number"][trans])
+        #    if usaidaward != "" and usaidaward != 'nan' and "Administrative Costs" not in usaidaward:
+        #        identifier = SubElement(activity, 'iati-identifier', ref=usaidaward)
+        # except ValueError:
+        #    usaidaward = ''
+
+        # Variables that depend on entries
+        # The amount comes from the first of disbursement, commitment and received amounts that has a value,
+        # see normalize.CHAINS.
+        valueAmount = crscolumns["transaction_amount"][trans]
+
+        if valueAmount is not None:
+            transaction_code = crscolumns["transaction_code"][trans]
+            # The dates come from the columns configured in normalize.DATES and are left out when those are empty.
+            transaction_datetime = crscolumns["transaction_date"][trans]
+            value_datetime = crscolumns["value_date"][trans]
+            valuedate = {'value-date': value_datetime} if value_datetime is not None else {}
+
+            transaction = SubElement(activity, 'transaction')
+            SubElement(transaction, 'transaction-type', code=transaction_code)
+            if transaction_datetime is not None:
+                SubElement(transaction, 'transaction-date', {'iso-date': transaction_datetime})
+            value = SubElement(transaction, 'value', valuedate)
+            value.text = valueAmount
+
+            country = crscolumns["recipient_code"][trans]
+            if country != '':
+                SubElement(transaction, 'recipient-country', code=country)
+
+            # sector
+            sector = crscolumns["purpose_code"][trans]
+            if sector is not None:
+                SubElement(transaction, 'sector', code=sector, percentage='100')
+
+            # Untied, partially tied or tied amount, see normalize.CHAINS.
+            valueAmount = crscolumns["tied_amount"][trans]
+
+            if valueAmount is not None:
+                tiedstatus = crscolumns["tied_code"][trans]
+
+                tied = SubElement(transaction, 'dac:tied-status', code=tiedstatus)
+
+                tied_date = SubElement(tied, 'dac:value', valuedate)
+                tied_date.text = valueAmount
+
+    # CRS-ADD fields, only written when the activity has other-flags
+    if any_value(crscolumns, FLAG_COLUMNS, activityRows):
+        build_crs_add(activity, crscolumns, activityRows)
+
+    return activity
+
+
+def build_crs_add(activity, crscolumns, activityRows):
+    """
+    Add the crs-add element of one activity. Fields that appear once take the first row with a value;
+    loan-status, grant-equivalent, other-amounts and mobilisation are written for every row that has them.
+    :param activity: The iati-activity element.
+    :param crscolumns: Normalized columns, see normalize.normalize.
+    :param activityRows: Positions of the activity's rows in crscolumns, in source order.
+    :return crsAdd: The crs-add element.
+    """
+    crsAdd = SubElement(activity, "crs-add")
+
+    # other-flags code=1-4
+    emit_flags(crsAdd, crscolumns, activityRows)
+
+    # DAC Loan Terms block, from the first row with a rate
+    # dac:loan-terms rate-1=["Interest_rate"] rate-2=["Second_interest_rate"]
+    #   dac:repayment-type code=["Type"]
+    #   dac:repayment-plan code=["No_repayments"]
+    #   dac:repayment-first-date iso-date=["First_repay_date"]
+    #   dac:repayment-final-date iso-date=["Final_repay_date"]
+    rates1 = crscolumns["Interest_rate"]
+    rates2 = crscolumns["Second_interest_rate"]
+    for line in activityRows:
+        rate1 = rates1[line]
+        rate2 = rates2[line]
+        if rate1 is None and rate2 is None:
+            continue
+        if rate1 is not None and rate2 is not None:
+            loanterms = SubElement(crsAdd, 'dac:loan-terms', {'rate-1': rate1, 'rate-2': rate2})
+        elif rate1 is not None:
+            loanterms = SubElement(crsAdd, 'dac:loan-terms', {'rate-1': rate1})
+        else:
+            loanterms = SubElement(crsAdd, 'dac:loan-terms', {'rate-2': rate2})
+
+        repaymentType = crscolumns["Type"][line]
+        repaymentPlan = crscolumns["No_repayments"][line]
+        repaymentFirst = crscolumns["First_repay_date"][line]
+        repaymentFinal = crscolumns["Final_repay_date"][line]
+        if repaymentType is not None:
+            SubElement(loanterms, 'dac:repayment-type', code=repaymentType)
+        if repaymentPlan is not None:
+            SubElement(loanterms, 'dac:repayment-plan', code=repaymentPlan)
+        if repaymentFirst is not None:
+            SubElement(loanterms, 'dac:repayment-first-date', {'iso-date': repaymentFirst})
+        if repaymentFinal is not None:
+            SubElement(loanterms, 'dac:repayment-final-date', {'iso-date': repaymentFinal})
+        break
+
+    for line in activityRows:
+
+        reportyear = crscolumns["reporting_year"][line]
+        comdate = crscolumns["commitment_date"][line]
+
+        # dac:grant-equivalent value=["grant_equivalent"]
+        grantAmount = crscolumns["grant_equivalent"][line]
+        if grantAmount is not None:
+            SubElement(crsAdd, 'dac:grant-equivalent', value=grantAmount)
+
+        # loan-status year="" value-date=""
+        #   interest-received ["interest_received"]
+        #   principal-outstanding ["Principa_disbursed"]
+        #   principal-arrears ["Principal_arrears"]
+        #   interest-arrears ["arrears_interest"]
+        interestAmount = crscolumns["interest_received"][line]
+        prinAmount = crscolumns["Principa_disbursed"][line]
+        prinarrAmount = crscolumns["Principal_arrears"][line]
+        interestarrAmount = crscolumns["arrears_interest"][line]
+        if interestAmount is not None or prinAmount is not None or prinarrAmount is not None \
+                or interestarrAmount is not None:
+            loanstatus = SubElement(crsAdd, 'loan-status')
+            if comdate is not None:
+                loanstatus.set('value-date', comdate)
+            if reportyear is not None:
+                loanstatus.set('year', reportyear)
+            if interestAmount is not None:
+                intrec = SubElement(loanstatus, 'interest-received')
+                intrec.text = interestAmount
+            if prinAmount is not None:
+                principaloutstanding = SubElement(loanstatus, 'principal-outstanding')
+                principaloutstanding.text = prinAmount
+            if prinarrAmount is not None:
+                principalarrears = SubElement(loanstatus, 'principal-arrears')
+                principalarrears.text = prinarrAmount
+            if interestarrAmount is not None:
+                interestarrears = SubElement(loanstatus, 'interest-arrears')
+                interestarrears.text = interestarrAmount
+
+    # channel-code ["channel_code"]
+    # dac:channel-description
+    #   narrative ["channel_name"]
+    # dac:reporting-year ["reporting_year"]
+    # dac:donorcode code=["reporting_country"]
+    # dac:agency code=["extending_agency"]
+    # dac:nature-submission code=["nature_of_submission"]
+    # dac:commitment-date iso-date=["commitment_date"]
+    # dac:currency code=["currency"]
+    emit_crs_add_fields(crsAdd, crscolumns, activityRows)
+
+    for line in activityRows:
+
+        comdate = crscolumns["commitment_date"][line]
+
+        # Value dates are only set when the commitment date is known.
+        valuedate = {'value-date': comdate} if comdate is not None else {}
+
+        # dac:other-amounts code=1-4
+        #   dac:value value-date=""
+        emit_other_amounts(crsAdd, crscolumns, line, valuedate)
+
+        # dac:mobilisation
+        #   dac:mobilisation-leverage code=["Leverage_mech"]
+        #   dac:mobilisation-origin code=["Orgin_of_funds"]
+        #   dac:value ["Amounts_mobilized"]
+        leverage = crscolumns["Leverage_mech"][line]
+        origin = crscolumns["Orgin_of_funds"][line]
+        mobilvalue = crscolumns["Amounts_mobilized"][line]
+        if leverage is not None or origin is not None or mobilvalue is not None:
+            mobilisation = SubElement(crsAdd, 'dac:mobilisation')
+            if leverage is not None:
+                SubElement(mobilisation, 'dac:mobilisation-leverage', code=leverage)
+            if origin is not None:
+                SubElement(mobilisation, 'dac:mobilisation-origin', code=origin)
+            if mobilvalue is not None:
+                mobvalue = SubElement(mobilisation, 'dac:value')
+                mobvalue.text = mobilvalue
+
+    return crsAdd
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+from .normalize import CHAINS, DATES, DEFAULT_DATE, SOURCE_COLUMNS
+
+# Modules whose code decides what is read and how it is normalized. An entry written by other code is not used.
+READER_MODULES = ['cache.py', 'readers.py', 'normalize.py', 'dates.py', 'mapping.py', 'countries.py']
+
+
+def file_hash(filetoopen):
+    """
+    Return the SHA-256 of a file's content.
+    :param filetoopen: Path to the file.
+    :return digest: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(filetoopen, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(filetoopen, version):
+    """
+    Return the cache key for a source file. The key changes with the file content, the converter version,
+    the code of READER_MODULES, the set of source and derived columns and the date chains and default.
+    :param filetoopen: Path to the source file.
+    :param version: The converter version.
+    :return key: The hex key.
+    """
+    key = hashlib.sha256()
+    key.update(file_hash(filetoopen).encode())
+    key.update(str(version).encode())
+    for name in READER_MODULES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as sourcefile:
+            key.update(sourcefile.read())
+    key.update('\0'.join(SOURCE_COLUMNS + sorted(CHAINS)).encode())
+    key.update(repr((sorted(DATES.items()), DEFAULT_DATE)).encode())
+    return key.hexdigest()
+
+
+def _dump(path, value):
+    """
+    Write a value to a cache file.
+    :param path: The cache file.
+    :param value: The value to store.
+    """
+    with open(path, 'wb') as cachefile:
+        pickle.dump(value, cachefile, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load(path):
+    """
+    Read a value from a cache file.
+    :param path: The cache file.
+    :return value: The stored value.
+    """
+    with open(path, 'rb') as cachefile:
+        return pickle.load(cachefile)
+
+
+def find_entry(cachedir, key):
+    """
+    Return the cache entry for a key if a complete one exists.
+    :param cachedir: The cache directory.
+    :param key: See cache_key.
+    :return entry: The entry directory, or None.
+    """
+    entry = os.path.join(cachedir, key)
+    if os.path.exists(os.path.join(entry, 'manifest.json')):
+        return entry
+    return None
+
+
+def read_manifest(entry):
+    """
+    :param entry: A cache entry, see find_entry.
+    :return manifest: Dictionary with the source path, header, chunk count and skipped blank rows.
+    """
+    with open(os.path.join(entry, 'manifest.json'), encoding='utf-8') as manifest:
+        return json.load(manifest)
+
+
+def load_ids(entry):
+    """
+    :param entry: A cache entry, see find_entry.
+    :return ids: The cached crs_id_number column.
+    """
+    return _load(os.path.join(entry, 'ids.pickle'))
+
+
+def load_chunks(entry):
+    """
+    Yield the cached normalized chunks one at a time.
+    :param entry: A cache entry, see find_entry.
+    :return: Normalized columns for consecutive slices of the file, see normalize.normalize.
+    """
+    for number in range(read_manifest(entry)['chunks']):
+        yield _load(os.path.join(entry, 'chunk-{0:05d}.pickle'.format(number)))
+
+
+class CacheWriter:
+    """
+    Store the ids and normalized chunks of a source file while it is converted.
+    The entry is only visible once commit is called, so an interrupted run leaves no partial entry.
+    """
+
+    def __init__(self, cachedir, key, filetoopen, header):
+        """
+        :param cachedir: The cache directory.
+        :param key: See cache_key.
+        :param filetoopen: Path to the source file.
+        :param header: The column names of the source file.
+        """
+        os.makedirs(cachedir, exist_ok=True)
+        self.cachedir = cachedir
+        self.key = key
+        self.staging = tempfile.mkdtemp(prefix='.' + key[:12] + '-', dir=cachedir)
+        self.manifest = {'source': os.path.abspath(filetoopen), 'header': list(header), 'chunks': 0}
+
+    def add_ids(self, ids, skipped=()):
+        """
+        :param ids: The crs_id_number column.
+        :param skipped: The row numbers of the blank rows the readers skipped.
+        :return ids: The same ids, so the call can wrap the reader.
+        """
+        _dump(os.path.join(self.staging, 'ids.pickle'), ids)
+        self.manifest['skipped'] = list(skipped)
+        return ids
+
+    def add_chunk(self, crscolumns):
+        """
+        :param crscolumns: The normalized columns of the next chunk.
+        :return crscolumns: The same columns, so the call can wrap the reader.
+        """
+        _dump(os.path.join(self.staging, 'chunk-{0:05d}.pickle'.format(self.manifest['chunks'])), crscolumns)
+        self.manifest['chunks'] += 1
+        return crscolumns
+
+    def commit(self):
+        """
+        Publish the entry and remove older entries for the same source file.
+        """
+        with open(os.path.join(self.staging, 'manifest.json'), 'w', encoding='utf-8') as manifest:
+            json.dump(self.manifest, manifest)
+        entry = os.path.join(self.cachedir, self.key)
+        for name in os.listdir(self.cachedir):
+            other = os.path.join(self.cachedir, name)
+            if other not in (entry, self.staging) and find_entry(self.cachedir, name) \
+                    and read_manifest(other)['source'] == self.manifest['source']:
+                shutil.rmtree(other, ignore_errors=True)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(self.staging, entry)
+
+    def discard(self):
+        """
+        Remove the unfinished entry.
+        """
+        shutil.rmtree(self.staging, ignore_errors=True)
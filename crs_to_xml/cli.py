@@ -0,0 +1,162 @@
+import argparse
+import signal
+import sys
+
+from .convert import Converter, Options
+from .instrument import Instrumentation
+from .merge import POLICIES
+from .shards import SHARD_KEYS
+from .writer import BLOCKSIZE, COMPRESSIONS
+
+# The source file converted when none is given.
+DEFAULT_INPUT = 'crs/new_crs1.xlsx'
+
+
+def parse_args(argv=None):
+    """
+    :param argv: The arguments, sys.argv[1:] when None.
+    :return args: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(prog='crs-to-xml', description='Convert CRS files to IATI XML.')
+    parser.add_argument('inputs', nargs='*', metavar='FILE',
+                        help='CRS files to convert, one output each. Defaults to ' + DEFAULT_INPUT + '.')
+    parser.add_argument('--output', default='export', metavar='DIR',
+                        help='Write to DIR/<date>/, or DIR/zip/ for zip. Outputs are named after their input.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Build activities in this many processes. The output is the same for any value.')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='Keep the parsed input here and reuse it while the file and converter are unchanged.')
+    parser.add_argument('--report', metavar='FILE', help='Write timings and counters for the run as JSON.')
+    parser.add_argument('--progress', action='store_true', help='Show a progress line while converting.')
+    parser.add_argument('--profile', metavar='FILE', help='Write cProfile statistics for the run.')
+    parser.add_argument('--trace-memory', action='store_true', help='Record peak Python memory with tracemalloc.')
+    parser.add_argument('--compression', choices=sorted(COMPRESSIONS),
+                        help='Compress the output while it is written. zip writes DIR/zip/<name>-<date>.zip, '
+                             'the others DIR/<date>/<name>.xml with .gz, .zst or no suffix. Defaults to zip, '
+                             'or gzip with --index.')
+    parser.add_argument('--shard-activities', type=int, metavar='N', help='Split the output, N activities per file.')
+    parser.add_argument('--shard-bytes', type=int, metavar='N',
+                        help='Split the output, at most N bytes of uncompressed activities per file.')
+    parser.add_argument('--shard-key', choices=sorted(SHARD_KEYS), help='Split the output by this field.')
+    parser.add_argument('--shard-threads', type=int, default=4, help='Threads writing shards.')
+    parser.add_argument('--index', action='store_true',
+                        help='Write <name>-index.tsv with the location of every activity, see index.ActivityIndex. '
+                             'Lookups read one block of gzip, zstd or uncompressed output, but a zip file from '
+                             'its start.')
+    parser.add_argument('--block-size', type=int, default=BLOCKSIZE, metavar='BYTES',
+                        help='With --index, compress gzip and zstd output in independent blocks of this size.')
+    parser.add_argument('--incremental', metavar='DIR',
+                        help='Keep each activity here and only rebuild the ones whose rows changed since the last run.')
+    parser.add_argument('--validate', action='store_true',
+                        help='Check every activity against the bundled IATI schema and write <name>-validation.tsv.')
+    parser.add_argument('--validate-workers', type=int, default=1, metavar='N',
+                        help='With --validate, validate in this many processes.')
+    parser.add_argument('--merge', choices=POLICIES,
+                        help='Convert all files into one output. An activity found in several files takes the rows of '
+                             'the last of them (latest) or of all of them without repeated rows (union), '
+                             'and is listed in <name>-merge.tsv.')
+    parser.add_argument('--name', help='Name the output NAME instead of after its input, or "merged" with --merge.')
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help='Hold about MB megabytes of source rows at a time and keep the rest in run files on disk, '
+                             'for inputs whose activities are spread over more rows than fit in memory.')
+    parser.add_argument('--spill-dir', metavar='DIR',
+                        help='Write the run files of --memory-budget, and workbooks read ahead of grouping, here '
+                             'instead of the temporary directory.')
+    parser.add_argument('--country-aliases', metavar='FILE',
+                        help='Read recipient country names with this alias table (a CSV file with name and code '
+                             'columns) instead of the packaged country_aliases.csv.')
+    parser.add_argument('--verify', metavar='OUTPUT',
+                        help='Instead of converting, read OUTPUT (a document or a shard manifest) back and compare it '
+                             'with the input files, writing the differences to <name>-roundtrip.tsv next to it.')
+    parser.add_argument('--verify-workers', type=int, default=1, metavar='N',
+                        help='With --verify, parse this many output files at a time.')
+    parser.add_argument('--watch', metavar='DIR',
+                        help='Run as a service: convert every new or changed file dropped into DIR, see service.py.')
+    parser.add_argument('--service-workers', type=int, default=2, metavar='N',
+                        help='With --watch, files converted at a time.')
+    parser.add_argument('--queue-size', type=int, default=16, metavar='N',
+                        help='With --watch, files that may wait for a worker. Further files wait in the folder.')
+    parser.add_argument('--poll', type=float, default=2.0, metavar='SECONDS', help='With --watch, time between scans.')
+    parser.add_argument('--status', metavar='FILE', help='With --watch, keep the service status in this JSON file.')
+    parser.add_argument('--status-port', type=int, metavar='PORT',
+                        help='With --watch, serve the service status on http://127.0.0.1:PORT/.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Convert the files on the command line, one after another in this process.
+    :param argv: The arguments, sys.argv[1:] when None.
+    """
+    args = parse_args(argv)
+    # Block gzip keeps indexed lookups to one block, see index.ActivityIndex.
+    compression = args.compression or ('gzip' if args.index else 'zip')
+    options = Options(workers=args.workers, cache=args.cache, compression=compression,
+                      shard_activities=args.shard_activities, shard_bytes=args.shard_bytes, shard_key=args.shard_key,
+                      shard_threads=args.shard_threads, index=args.index, block_size=args.block_size,
+                      incremental=args.incremental, validate=args.validate, validate_workers=args.validate_workers,
+                      progress=args.progress, merge=args.merge or 'latest', name=args.name,
+                      memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget is not None else None,
+                      spill_dir=args.spill_dir, country_aliases=args.country_aliases)
+    if args.watch is not None:
+        watch(args, options)
+        return
+    if args.verify is not None:
+        verify(args, options)
+        return
+    instruments = Instrumentation(args.report is not None, args.progress, profile=args.profile,
+                                  tracemem=args.trace_memory)
+    inputs = args.inputs or [DEFAULT_INPUT]
+    failed = []
+    with Converter(options, log=print) as converter:
+        for filetoopen in [inputs] if args.merge is not None else inputs:
+            name = filetoopen if isinstance(filetoopen, str) else ', '.join(filetoopen)
+            try:
+                converter.convert(filetoopen, args.output, instruments)
+            except FileNotFoundError as error:
+                print(error)
+                failed.append(error.filename)
+            except Exception as error:
+                # A file that cannot be read or converted does not stop the files after it.
+                print('Failed {0}: {1}: {2}'.format(name, type(error).__name__, error))
+                failed.append(name)
+    instruments.extra['workers'] = args.workers
+    instruments.extra['compression'] = compression
+    if args.report is not None:
+        instruments.write_report(args.report)
+    elif instruments.enabled:
+        instruments.print_report()
+    if failed:
+        sys.exit('Not converted: ' + ', '.join(failed))
+    print('Complete!')
+
+
+def watch(args, options):
+    """
+    Run the watch-folder service until interrupted or terminated.
+    :param args: The parsed arguments.
+    :param options: The conversion Options.
+    """
+    from .service import WatchService
+
+    service = WatchService(args.watch, args.output, options, args.service_workers, args.queue_size, args.poll,
+                           statusfile=args.status)
+    if args.status_port is not None:
+        service.serve_status(args.status_port)
+    signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+    print('Watching {0}, writing to {1}'.format(args.watch, args.output))
+    service.run()
+
+
+def verify(args, options):
+    """
+    Compare an output with its input files and exit with an error if they differ.
+    :param args: The parsed arguments.
+    :param options: The conversion Options.
+    """
+    inputs = args.inputs or [DEFAULT_INPUT]
+    with Converter(options, log=print) as converter:
+        summary = converter.verify(inputs if len(inputs) > 1 else inputs[0], args.verify, args.verify_workers)
+    if summary['matched'] != summary['activities'] or summary['extra'] or summary['repeated']:
+        sys.exit('Output differs from its input, see ' + summary['report'])
+    print('Complete!')
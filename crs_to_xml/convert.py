@@ -0,0 +1,497 @@
+import datetime
+import errno
+import os
+import time
+from collections import Counter, deque, namedtuple
+
+from . import __version__
+from .builder import build_activity
+from .incremental import FingerprintStore, reuse_fragments, store_version
+from .index import IndexWriter, record_activities
+from .instrument import Instrumentation
+from .parallel import build_parallel
+from .shards import ShardWriter
+from .validate import HEADER, HEADER_MESSAGE, Validator
+from .writer import BLOCKSIZE, COMPRESSIONS, ActivityWriter, open_output, serialize_activity
+
+# pandas, numpy and pycountry are imported on first use, by open_files and Converter.
+
+# The alias table for recipient country names, see countries.load_aliases.
+ALIASES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'country_aliases.csv')
+
+VERSION = '2.03'
+FASITE = 'https://explorer.usaid.gov/'
+DACSITE = 'http://www.oecd.org/dac/'
+
+# Settings of a conversion. The defaults match the command line.
+# workers: build activities in this many processes. cache: directory for the parsed input.
+# compression: see writer.COMPRESSIONS. shard_activities, shard_bytes, shard_key, shard_threads: see shards.ShardWriter.
+# index: write the sidecar index. block_size: compressed block size with an index. incremental: directory of the
+# stores, one per source file, see incremental.FingerprintStore. validate, validate_workers: see validate.Validator.
+# progress: show a progress line. merge: how several files converted together are combined, see merge.POLICIES.
+# name: the output name, by default the source file name or "merged".
+# memory_budget: bytes of source rows to hold at a time, spilling the rest to spill_dir, see spill.spill_activities.
+# spill_dir also holds the normalized chunks of workbooks while they are grouped, see read_source.
+# country_aliases: the alias table for recipient country names, ALIASES by default.
+Options = namedtuple('Options', ['workers', 'cache', 'compression', 'shard_activities', 'shard_bytes', 'shard_key',
+                                 'shard_threads', 'index', 'block_size', 'incremental', 'validate',
+                                 'validate_workers', 'progress', 'merge', 'name', 'memory_budget', 'spill_dir',
+                                 'country_aliases'],
+                     defaults=[1, None, 'zip', None, None, None, 4, False, BLOCKSIZE, None, False, 1, False,
+                               'latest', None, None, None, None])
+
+
+def read_source(filetoopen, cachedir=None, log=print, spooldir=None, skipped=None, prepare=None):
+    """
+    Read the activity ids of a crs file. The rest of the file is streamed in chunks while converting.
+    Workbooks are read once, keeping the normalized chunks in spooldir until they are used.
+    :param filetoopen: The crs source file.
+    :param cachedir: Optional directory for the cache of parsed and normalized input.
+    :param log: Function called with progress messages.
+    :param spooldir: Directory for the chunks of a workbook, the system temporary directory by default.
+    :param skipped: Optional list the row numbers of the blank rows the readers skip are appended to.
+    :param prepare: Function turning each DataFrame chunk into columns, normalize.normalize by default.
+                    The cache holds normalized columns, so give no cachedir with another function.
+    :return crsids: The crs_id_number column
+    :return crschunks: The normalized columns of the crs file, chunk by chunk
+    :return crscache: The CacheWriter to commit once the chunks are used, or None
+    """
+    from .cache import CacheWriter, cache_key, find_entry, load_chunks, load_ids, read_manifest
+    from .normalize import SOURCE_COLUMNS, normalize
+    from .readers import file_kind, read_chunks, read_header, read_ids, spool_chunks
+
+    if prepare is None:
+        prepare = normalize
+    log('Opening CRS file {0}...'.format(filetoopen))
+    if not os.path.exists(filetoopen):
+        raise FileNotFoundError(errno.ENOENT, 'CRS file does not exist', filetoopen)
+    # Read the file
+    crscache = None
+    entry = None
+    if cachedir is not None:
+        key = cache_key(filetoopen, __version__)
+        entry = find_entry(cachedir, key)
+    if entry is not None:
+        log('Using cached CRS data.')
+        header = read_manifest(entry)['header']
+        crsids = load_ids(entry)
+        crschunks = load_chunks(entry)
+        if skipped is not None:
+            skipped.extend(read_manifest(entry).get('skipped', []))
+    else:
+        header = read_header(filetoopen)
+        blank = []
+        if file_kind(filetoopen) == 'csv':
+            # The id column of a delimited file is read on its own quickly.
+            crsids = read_ids(filetoopen, skipped=blank)
+            crschunks = (prepare(chunk) for chunk in read_chunks(filetoopen, SOURCE_COLUMNS))
+        else:
+            crsids, crschunks = spool_chunks(filetoopen, SOURCE_COLUMNS, prepare, spooldir, skipped=blank)
+        if skipped is not None:
+            skipped.extend(blank)
+        if cachedir is not None:
+            crscache = CacheWriter(cachedir, key, filetoopen, header)
+            crscache.add_ids(crsids, blank)
+            crschunks = (crscache.add_chunk(crscolumns) for crscolumns in crschunks)
+    # Output the number of rows
+    log('Total rows: {0}'.format(len(crsids)))
+    # See which headers are available
+    log(header)
+
+    return crsids, crschunks, crscache
+
+
+def open_files(files, cachedir=None, log=print, spooldir=None, skipped=None, prepare=None):
+    """
+    Read the activity ids of one or more crs files and group their rows. The files are read one
+    after another as one source, so an activity found in several files is one group.
+    :param files: List of crs source files.
+    :param cachedir: Optional directory for the cache of parsed and normalized input.
+    :param log: Function called with progress messages.
+    :param spooldir: Directory for the chunks of workbooks, see read_source.
+    :param skipped: Optional list that gets, for each file, the row numbers of its blank rows, see read_source.
+    :param prepare: See read_source.
+    :return crsgrouping: The rows of each activity, see grouping.group_split
+    :return crschunks: The normalized columns of the files, chunk by chunk
+    :return crscaches: The CacheWriters to commit once the chunks are used
+    :return fileoffsets: Position of the first row of each file and, last, the total number of rows
+    """
+    from itertools import chain
+
+    from .grouping import group_split
+
+    crsids = []
+    sources = []
+    crscaches = []
+    fileoffsets = [0]
+    for filetoopen in files:
+        blank = []
+        ids, crschunks, crscache = read_source(filetoopen, cachedir, log, spooldir, blank, prepare)
+        if skipped is not None:
+            skipped.append(blank)
+        crsids.extend(ids)
+        sources.append(crschunks)
+        if crscache is not None:
+            crscaches.append(crscache)
+        fileoffsets.append(len(crsids))
+    crsgrouping = group_split(crsids)
+    return crsgrouping, chain.from_iterable(sources), crscaches, fileoffsets
+
+
+def group_activities(grouping, chunks, options, log=print):
+    """
+    Gather the rows of each activity while the source is read, in memory or, with a memory budget, on disk.
+    :param grouping: The rows of each activity, see grouping.group_split.
+    :param chunks: The normalized columns of the source, chunk by chunk.
+    :param options: The Options.
+    :param log: Function called with progress messages.
+    :return: Tuples of activity id, columns and row positions, in first-appearance order.
+    """
+    if options.memory_budget is not None:
+        from .spill import spill_activities
+
+        return spill_activities(grouping, chunks, options.memory_budget, options.spill_dir, log)
+    from .grouping import stream_activities
+
+    return stream_activities(grouping, chunks)
+
+
+def count_undated(crsactivities, undated):
+    """
+    Count the transactions written without a transaction date or value date, as no column of their
+    date chain has one and normalize.DEFAULT_DATE is not set.
+    :param crsactivities: Tuples of activity id, columns and row positions, see grouping.stream_activities.
+    :param undated: Counter the transactions are counted in, by activity id.
+    :return: The same activities.
+    """
+    for activityid, crscolumns, activityRows in crsactivities:
+        amounts = crscolumns["transaction_amount"]
+        transactiondates = crscolumns["transaction_date"]
+        valuedates = crscolumns["value_date"]
+        rows = sum(1 for row in activityRows if amounts[row] is not None
+                   and (transactiondates[row] is None or valuedates[row] is None))
+        if rows:
+            undated[activityid] += rows
+        yield activityid, crscolumns, activityRows
+
+
+def resolve_countries(crscolumns, resolver):
+    """
+    Add the resolved recipient country codes to a chunk of normalized columns.
+    :param crscolumns: The normalized columns of a chunk.
+    :param resolver: The CountryResolver shared by all chunks.
+    :return crscolumns: The same columns with "recipient_code" added.
+    """
+    crscolumns["recipient_code"] = resolver.resolve_column(crscolumns["recipient_country"])
+    return crscolumns
+
+
+def output_paths(name, output, options, day):
+    """
+    Return where a conversion writes.
+    :param name: The output name.
+    :param output: The export directory.
+    :param options: The Options.
+    :param day: The date directory, as month-day-year.
+    :return outputdir: The directory written to, with a trailing slash.
+    :return outputpath: The output document, or the shard manifest, without the compression suffix.
+    """
+    sharded = options.shard_activities is not None or options.shard_bytes is not None or options.shard_key is not None
+    if sharded:
+        # Standalone documents in <output>/<date>/, listed in <name>-manifest.json.
+        outputdir = os.path.join(output, day) + '/'
+        return outputdir, outputdir + name + '-manifest.json'
+    if options.compression == 'zip':
+        # This is to write to a singular file, compressed as it is written.
+        outputdir = os.path.join(output, 'zip') + '/'
+        return outputdir, outputdir + name + '-' + day
+    outputdir = os.path.join(output, day) + '/'
+    return outputdir, outputdir + name + '.xml'
+
+
+class Converter:
+    """
+    Convert CRS files to IATI XML, one after another. The country resolver and, with workers,
+    the process pool are kept between files, so only the first file pays for setting them up.
+    """
+
+    def __init__(self, options=None, log=None):
+        """
+        :param options: The Options, or a dictionary of them. Missing settings take the defaults.
+        :param log: Function called with progress messages, such as print. None is silent.
+        """
+        if options is None:
+            options = Options()
+        elif isinstance(options, dict):
+            options = Options(**options)
+        self.options = options
+        self.log = log if log is not None else (lambda message: None)
+        self.resolver = None
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _resolver(self):
+        """
+        :return resolver: The CountryResolver shared by the files, created on first use.
+        """
+        from .countries import CountryResolver
+
+        if self.resolver is None:
+            aliasfile = self.options.country_aliases or ALIASES
+            if not os.path.exists(aliasfile):
+                raise FileNotFoundError(errno.ENOENT, 'Country alias table does not exist', aliasfile)
+            self.resolver = CountryResolver(aliasfile)
+        return self.resolver
+
+    def _build(self, crsactivities, date):
+        """
+        Build and serialize activities, in this process or the pool.
+        :param crsactivities: Tuples of activity id, columns and row positions, see grouping.stream_activities.
+        :param date: The timestamp for last-updated-datetime.
+        :return: Serialized activities, in order.
+        """
+        if self.options.workers > 1:
+            if self.pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+
+                self.pool = ProcessPoolExecutor(max_workers=self.options.workers)
+            return build_parallel(crsactivities, date, self.options.workers, self.pool)
+        return (serialize_activity(build_activity(crscolumns, activityid, activityRows, date))
+                for activityid, crscolumns, activityRows in crsactivities)
+
+    def convert(self, filetoopen, output='export', instruments=None):
+        """
+        Convert one CRS file, or several into one output.
+        :param filetoopen: The crs source file: .xlsx, .csv, .tsv or any workbook pandas reads. A list of files
+                           is merged, see merge.Merger: activities found in more than one are combined by the
+                           merge option and reported in <name>-merge.tsv.
+        :param output: The export directory. Files go to <output>/<date>/ or, for zip, <output>/zip/.
+        :param instruments: Optional Instrumentation the run is timed and counted in.
+        :return summary: Dictionary of what was written: output, activities, rows and the per-run details.
+        """
+        from .merge import Merger
+
+        files = [filetoopen] if isinstance(filetoopen, str) else list(filetoopen)
+
+        options = self.options
+        log = self.log
+        if instruments is None:
+            instruments = Instrumentation(progress=options.progress)
+        sharded = any(setting is not None for setting in (options.shard_activities, options.shard_bytes,
+                                                          options.shard_key))
+        date = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]+'Z'
+
+        with instruments.phase('open'):
+            skipped = []
+            crsgrouping, crschunks, crscaches, fileoffsets = open_files(files, options.cache, log, options.spill_dir,
+                                                                        skipped)
+        merger = None
+        if len(files) > 1:
+            merger = Merger(files, fileoffsets, crsgrouping, options.merge)
+        log("Converting format...")
+        log('Total activities: {0}'.format(len(crsgrouping.ids)))
+
+        resolver = self._resolver()
+        # The resolver is shared, so this file's lookups are what it added.
+        hits = resolver.hits
+        cached = len(resolver.cache)
+        misses = Counter(resolver.misses)
+
+        crschunks = (resolve_countries(crscolumns, resolver) for crscolumns in instruments.watch_chunks(crschunks))
+        crsactivities = group_activities(crsgrouping, crschunks, options, log)
+        if merger is not None:
+            crsactivities = merger.merge(crsactivities)
+        undated = Counter()
+        crsactivities = count_undated(crsactivities, undated)
+        # The id and index fields of every activity, in output order.
+        records = deque()
+        if options.shard_key is not None or options.index:
+            crsactivities = record_activities(crsactivities, records)
+
+        attrib = {'version': VERSION, 'generated-datetime': date, 'xmlns:usg': FASITE, 'xmlns:dac': DACSITE}
+        name = options.name
+        if name is None:
+            name = os.path.splitext(os.path.basename(files[0]))[0] if merger is None else 'merged'
+        outputdir, outputpath = output_paths(name, output, options, time.strftime("%m-%d-%Y"))
+        store = None
+        if options.incremental is not None:
+            # One store per source file, so converting several files does not mix their activities.
+            store = FingerprintStore(os.path.join(options.incremental, name), store_version(__version__))
+            fragments = reuse_fragments(crsactivities, store, lambda activities: self._build(activities, date))
+        else:
+            fragments = self._build(crsactivities, date)
+
+        if not os.path.exists(outputdir):
+            os.makedirs(outputdir)
+        index = None
+        blocksize = None
+        if options.index:
+            if options.compression == 'zip' and not sharded:
+                log('Warning: a zip entry is one deflate stream, so every indexed lookup decompresses the output '
+                    'from its start. Use gzip or zstd compression, or shards, for lookups that read one block.')
+                indexpath = outputpath + '-index.tsv'
+            else:
+                indexpath = outputdir + name + '-index.tsv'
+            index = IndexWriter(indexpath, attrib, options.compression)
+            blocksize = options.block_size
+        validator = None
+        if options.validate:
+            validationpath = outputdir + name + '-validation.tsv'
+            sources = ([os.path.basename(filetoopen) for filetoopen in files], fileoffsets, skipped)
+            validator = Validator(attrib, crsgrouping, validationpath, options.validate_workers, sources,
+                                  merger.keptrows if merger is not None else None)
+            fragments = validator.watch(fragments)
+        try:
+            with instruments.phase('convert'):
+                fragments = instruments.watch_fragments(fragments, len(crsgrouping.ids))
+                if sharded:
+                    with ShardWriter(outputdir, name, attrib, options.compression, options.shard_key,
+                                     options.shard_activities, options.shard_bytes, options.shard_threads,
+                                     index, blocksize) as shardwriter:
+                        for fragment in fragments:
+                            shardwriter.write(fragment, records.popleft() if records else None)
+                else:
+                    with open_output(outputpath, options.compression, name + '.xml',
+                                     blocksize=blocksize) as output_file:
+                        activities = ActivityWriter(output_file, 'iati-activities', attrib)
+                        for fragment in fragments:
+                            location = activities.write_fragment(fragment)
+                            if index is not None:
+                                activityid, fields = records.popleft()
+                                index.add(activityid, os.path.basename(outputpath) + COMPRESSIONS[options.compression],
+                                          location, fields)
+                        activities.close()
+                if validator is not None:
+                    invalid = validator.close()
+        except BaseException:
+            if validator is not None:
+                validator.abort()
+            for crscache in crscaches:
+                crscache.discard()
+            if store is not None:
+                store.discard()
+            raise
+        finally:
+            if index is not None:
+                index.close()
+        for crscache in crscaches:
+            crscache.commit()
+
+        written = outputpath if sharded else outputpath + COMPRESSIONS[options.compression]
+        summary = {'input': filetoopen, 'output': written, 'activities': len(crsgrouping.ids),
+                   'rows': len(crsgrouping.rows)}
+        if store is not None:
+            removed = store.removed()
+            store.commit()
+            log('Activities added: {0}, changed: {1}, removed: {2}, reused: {3}'.format(
+                len(store.added), len(store.changed), len(removed),
+                len(store.newindex) - len(store.added) - len(store.changed) if store.reusable else 0))
+            summary['incremental'] = {'added': store.added, 'changed': store.changed, 'removed': removed}
+        if merger is not None:
+            mergepath = outputdir + name + '-merge.tsv'
+            merger.write_report(mergepath)
+            log('Activities in more than one file: {0}, conflicting: {1}, rows left out: {2}, see {3}'.format(
+                len(merger.duplicates), merger.conflicting(), merger.dropped, mergepath))
+            summary['merge'] = {'policy': merger.policy, 'duplicates': len(merger.duplicates),
+                                'conflicts': merger.conflicting(), 'rows left out': merger.dropped}
+        if validator is not None:
+            log('Activities validated: {0}, invalid: {1}'.format(validator.activities, invalid))
+            log('  ' + HEADER_MESSAGE)
+            for message, count in validator.messages.most_common(10):
+                log('  {0} x {1}'.format(count, message))
+            if invalid:
+                log('See ' + validationpath)
+            summary['validation'] = {'activities': validator.activities, 'invalid': invalid,
+                                     'errors': dict(validator.messages), 'not written': list(HEADER)}
+
+        if undated:
+            log('Warning: {0} transactions in {1} activities have no date, as no column of their date chain has '
+                'one. Set normalize.DEFAULT_DATE to date them. First activities: {2}'.format(
+                    sum(undated.values()), len(undated), ', '.join(list(undated)[:10])))
+        summary['undated transactions'] = sum(undated.values())
+        misses = resolver.misses - misses
+        if misses:
+            log('Unresolved countries: {0}'.format(', '.join('{0} ({1} rows)'.format(country, rows)
+                                                             for country, rows in misses.most_common())))
+        if sharded:
+            log('Wrote {0} files, see {1}'.format(len(shardwriter.shards), written))
+            summary['shards'] = len(shardwriter.shards)
+        else:
+            log('Wrote ' + written)
+        summary['unresolved countries'] = dict(misses)
+        instruments.count('rows grouped', len(crsgrouping.rows))
+        instruments.count('transactions undated', sum(undated.values()))
+        instruments.count('country lookups', resolver.hits - hits + sum(misses.values()))
+        instruments.count('country names looked up', len(resolver.cache) - cached)
+        instruments.count('country rows unresolved', sum(misses.values()))
+        instruments.extra.setdefault('files', []).append(summary)
+        return summary
+
+    def verify(self, filetoopen, outputpath, workers=1):
+        """
+        Check an output against its source, see roundtrip.RoundTrip, and write the differences
+        to <name>-roundtrip.tsv next to the output.
+        :param filetoopen: The crs source file, or the list of files that were merged into the output.
+        :param outputpath: The output document, or the manifest of a sharded output.
+        :param workers: Output documents parsed at a time.
+        :return summary: Dictionary of the counts, see RoundTrip.summary, with the report file.
+        """
+        from .merge import Merger
+        from .roundtrip import RoundTrip, source_columns
+
+        files = [filetoopen] if isinstance(filetoopen, str) else list(filetoopen)
+        options = self.options
+        log = self.log
+        roundtrip = RoundTrip(outputpath, workers)
+        log('Reading {0} output files...'.format(len(roundtrip.files)))
+        roundtrip.read_output()
+
+        # The source is read without normalizing it, so the check does not repeat the converter's mistakes.
+        crsgrouping, crschunks, crscaches, fileoffsets = open_files(files, None, log, options.spill_dir,
+                                                                    prepare=source_columns)
+        resolver = self._resolver()
+        crschunks = (resolve_countries(crscolumns, resolver) for crscolumns in crschunks)
+        crsactivities = group_activities(crsgrouping, crschunks, options, log)
+        if len(files) > 1:
+            crsactivities = Merger(files, fileoffsets, crsgrouping, options.merge).merge(crsactivities)
+        roundtrip.check(crsactivities)
+
+        name = options.name
+        if name is None:
+            name = os.path.splitext(os.path.basename(files[0]))[0] if len(files) == 1 else 'merged'
+        reportpath = os.path.join(os.path.dirname(outputpath), name + '-roundtrip.tsv')
+        roundtrip.write_report(reportpath)
+        summary = roundtrip.summary()
+        log('Activities checked: {0}, matched: {1}, mismatched: {2}, missing: {3}, extra: {4}'.format(
+            summary['activities'], summary['matched'], summary['mismatched'], summary['missing'], summary['extra']))
+        for field, count in list(summary['fields'].items())[:10]:
+            log('  {0} x {1}'.format(count, field))
+        if summary['matched'] != summary['activities'] or summary['extra'] or summary['repeated']:
+            log('See ' + reportpath)
+        summary['report'] = reportpath
+        return summary
+
+
+def convert(filetoopen, output='export', options=None):
+    """
+    Convert one CRS file to IATI XML. To convert several, use one Converter for all of them.
+    :param filetoopen: The crs source file, or a list of files to merge into one output.
+    :param output: The export directory.
+    :param options: The Options, or a dictionary of them.
+    :return summary: See Converter.convert.
+    """
+    with Converter(options) as converter:
+        return converter.convert(filetoopen, output)
@@ -0,0 +1,87 @@
+import csv
+import os
+from collections import Counter
+
+import numpy
+import pandas
+import pycountry
+
+
+def normalize_name(name):
+    """
+    Return the lookup key for a country name.
+    :param name: A country name as written in the source file.
+    :return key: The case-folded name with runs of whitespace collapsed.
+    """
+    return ' '.join(str(name).casefold().split())
+
+
+def load_aliases(aliasfile):
+    """
+    Read the alias table that maps CRS-specific names to alpha-2 codes.
+    An empty code marks a name that is known but has no recipient country,
+    such as "Bilateral, unspecified" or the regional entries.
+    :param aliasfile: Path to a CSV file with name and code columns.
+    :return aliases: Dictionary of normalized name to alpha-2 code.
+    """
+    aliases = {}
+    with open(aliasfile, newline='', encoding='utf-8') as aliascsv:
+        for row in csv.DictReader(aliascsv):
+            aliases[normalize_name(row['name'])] = (row['code'] or '').strip().upper()
+    return aliases
+
+
+class CountryResolver:
+    """
+    Resolve recipient country names to alpha-2 codes.
+    The pycountry index is built once and every distinct name is only looked up once.
+    """
+
+    def __init__(self, aliasfile=None):
+        """
+        :param aliasfile: Optional alias table, see load_aliases. Aliases win over pycountry.
+        """
+        self.index = {}
+        # Same precedence as the old lookups: name, then common_name, then official_name.
+        for field in ('name', 'common_name', 'official_name'):
+            for country in pycountry.countries:
+                value = getattr(country, field, None)
+                if value:
+                    self.index.setdefault(normalize_name(value), country.alpha_2)
+        if aliasfile is not None and os.path.exists(aliasfile):
+            self.index.update(load_aliases(aliasfile))
+        self.cache = {}
+        self.hits = 0
+        self.misses = Counter()
+
+    def resolve(self, name):
+        """
+        Return the alpha-2 code for a single country name.
+        :param name: The recipient_country value.
+        :return code: The alpha-2 code, '' if the name has no recipient country, None if it is unknown.
+        """
+        if name not in self.cache:
+            self.cache[name] = self.index.get(normalize_name(name))
+        return self.cache[name]
+
+    def resolve_column(self, values):
+        """
+        Resolve a whole column, looking up each distinct value once.
+        Rows whose name is neither in pycountry nor in the alias table are counted in misses.
+        :param values: The recipient_country column, None for empty cells.
+        :return codes: A list of alpha-2 codes, '' where there is no recipient country.
+        """
+        valuecodes, names = pandas.factorize(pandas.Series(values, dtype=object), sort=False)
+        counts = numpy.bincount(valuecodes[valuecodes >= 0], minlength=len(names)).tolist()
+        lookup = []
+        for name, count in zip(names, counts):
+            code = self.resolve(name)
+            if code is None:
+                self.misses[name] += count
+                code = ''
+            else:
+                self.hits += count
+            lookup.append(code)
+        lookup.append('')
+        # factorize marks empty cells with -1, which picks the trailing ''.
+        return [lookup[k] for k in valuecodes.tolist()]
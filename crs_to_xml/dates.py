@@ -0,0 +1,137 @@
+import datetime
+
+import numpy
+import pandas
+
+# Day 0 of Excel serial dates. Counting from here skips Excel's 29 February 1900, so serials from 61 on are right.
+EXCEL_EPOCH = numpy.datetime64('1899-12-30', 'D')
+
+# Serials Excel can show as a date: 1900-01-01 to 9999-12-31.
+SERIAL_RANGE = (1, 2958465)
+
+# Whole numbers read as a year rather than a serial, which would put them in 1905 or 1906.
+YEAR_RANGE = (1900, 2100)
+
+# Dates written as text, year first: 2017-01-15, 2017/1/15 or 2017.01.15, with anything after the day ignored,
+# so a time or a time zone does not move the date.
+ISO_TEXT = r'^\s*(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?!\d)'
+
+NAT = numpy.datetime64('NaT', 'D')
+
+
+def _from_parts(years, months, days):
+    """
+    Return days from year, month and day columns, NaT where they are not a date.
+    :param years, months, days: Numeric Series of the same length.
+    :return dates: A datetime64[D] array.
+    """
+    if not len(years):
+        return numpy.array([], dtype='datetime64[D]')
+    dates = pandas.to_datetime(pandas.DataFrame({'year': years, 'month': months, 'day': days}), errors='coerce')
+    return dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+
+
+def _parse_distinct(values, dayfirst):
+    """
+    Parse the distinct values of a date column.
+    :param values: Object array of distinct non-empty values.
+    :param dayfirst: Read ambiguous text such as 01/02/2017 as day first.
+    :return dates: A datetime64[D] array, NaT where a value is not a date.
+    """
+    dates = numpy.full(len(values), NAT)
+    values = pandas.Series(values, dtype=object)
+
+    # Dates and timestamps keep the date they show, whatever their time zone.
+    stamps = values.map(lambda value: isinstance(value, (datetime.date, numpy.datetime64))).to_numpy(dtype=bool)
+    if stamps.any():
+        stamped = values[stamps].map(pandas.Timestamp)
+        dates[stamps] = _from_parts(stamped.map(lambda stamp: stamp.year), stamped.map(lambda stamp: stamp.month),
+                                    stamped.map(lambda stamp: stamp.day))
+
+    # Numbers, and text holding a number, are years when they look like one and Excel serials otherwise.
+    other = ~stamps & ~values.map(lambda value: isinstance(value, bool)).to_numpy(dtype=bool)
+    numbers = pandas.to_numeric(values.where(other), errors='coerce').to_numpy(dtype='float64', na_value=numpy.nan)
+    years = (numbers >= YEAR_RANGE[0]) & (numbers <= YEAR_RANGE[1]) & (numbers == numpy.floor(numbers))
+    dates[years] = (numbers[years].astype('int64') - 1970).astype('datetime64[Y]').astype('datetime64[D]')
+    serials = ~years & (numbers >= SERIAL_RANGE[0]) & (numbers <= SERIAL_RANGE[1])
+    dates[serials] = EXCEL_EPOCH + numpy.floor(numbers[serials]).astype('int64')
+
+    # Year-first text, then any other format pandas recognizes.
+    text = other & numpy.isnan(numbers)
+    if text.any():
+        strings = values[text].astype(str)
+        parts = strings.str.extract(ISO_TEXT).astype('float64')
+        parsed = _from_parts(parts[0], parts[1], parts[2])
+        rest = numpy.isnat(parsed) & parts[0].isna().to_numpy()
+        if rest.any():
+            parsed[rest] = _parse_text(strings[rest].tolist(), dayfirst)
+        dates[text] = parsed
+    return dates
+
+
+def _parse_text(strings, dayfirst):
+    """
+    Parse text in any format pandas recognizes, such as 01/15/2017 or 15 Jan 2017.
+    :param strings: List of distinct strings.
+    :param dayfirst: Read ambiguous dates as day first.
+    :return dates: A datetime64[D] array, NaT where a string is not a date.
+    """
+    try:
+        parsed = pandas.to_datetime(pandas.Series(strings), format='mixed', dayfirst=dayfirst, errors='coerce')
+        if parsed.dt.tz is not None:
+            parsed = parsed.dt.tz_localize(None)
+        return parsed.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    except (TypeError, ValueError, AttributeError):
+        # Mixed time zones make a column pandas will not combine, so those are read one by one.
+        dates = numpy.full(len(strings), NAT)
+        for k, string in enumerate(strings):
+            try:
+                stamp = pandas.Timestamp(pandas.to_datetime(string, dayfirst=dayfirst))
+            except (TypeError, ValueError, OverflowError):
+                continue
+            if stamp is not pandas.NaT:
+                dates[k] = numpy.datetime64(datetime.date(stamp.year, stamp.month, stamp.day), 'D')
+        return dates
+
+
+def to_dates(series, dayfirst=False):
+    """
+    Parse a date column: dates and timestamps, years, Excel serial numbers and text.
+    Every distinct value is parsed once, so a column costs about as much as its distinct dates.
+    :param series: The source column.
+    :param dayfirst: Read ambiguous text such as 01/02/2017 as day first.
+    :return dates: A datetime64[D] array, NaT for empty cells and values that are not a date.
+    """
+    if pandas.api.types.is_datetime64_any_dtype(series):
+        if getattr(series.dt, 'tz', None) is not None:
+            series = series.dt.tz_localize(None)
+        return series.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    codes, distinct = pandas.factorize(series, sort=False)
+    parsed = _parse_distinct(numpy.asarray(distinct, dtype=object), dayfirst)
+    dates = numpy.full(len(codes), NAT)
+    known = codes >= 0
+    dates[known] = parsed[codes[known]]
+    return dates
+
+
+def to_years(series):
+    """
+    Return the first day of the year in a year column, such as reporting_year.
+    :param series: The source column, holding years such as 2017.
+    :return dates: A datetime64[D] array, NaT where there is no year.
+    """
+    numbers = pandas.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=numpy.nan)
+    years = (numbers >= 1) & (numbers <= 9999) & (numbers == numpy.floor(numbers))
+    dates = numpy.full(len(numbers), NAT)
+    dates[years] = (numbers[years].astype('int64') - 1970).astype('datetime64[Y]').astype('datetime64[D]')
+    return dates
+
+
+def iso_dates(dates):
+    """
+    Format days as ISO dates.
+    :param dates: A datetime64[D] array.
+    :return mask, text: Boolean array of the days that are set, and their YYYY-MM-DD strings.
+    """
+    mask = ~numpy.isnat(dates)
+    return mask, numpy.datetime_as_string(dates[mask], unit='D')
@@ -0,0 +1,94 @@
+import bisect
+import re
+from collections import namedtuple
+
+import numpy
+import pandas
+
+# ids[k] is the k-th activity in order of first appearance and its rows are
+# rows[offsets[k]:offsets[k + 1]], in source order.
+Grouping = namedtuple('Grouping', ['ids', 'offsets', 'rows'])
+
+NON_DIGITS = re.compile(r"\D")
+
+
+def group_split(crs_ids):
+    """
+    Group the rows of the source file by activity in a single pass.
+    :param crs_ids: The crs_id_number column.
+    :return grouping: The activity ids, offsets and row indices.
+    """
+    # Strip the distinct raw values only, then fold them onto the stripped ids.
+    raw_codes, raw_ids = pandas.factorize(pandas.Series(crs_ids), sort=False, use_na_sentinel=False)
+    stripped = numpy.array([NON_DIGITS.sub("", str(crs_id)) for crs_id in raw_ids], dtype=object)
+    id_codes, ids = pandas.factorize(stripped, sort=False)
+    codes = id_codes[raw_codes]
+
+    rows = numpy.argsort(codes, kind='stable')
+    offsets = numpy.zeros(len(ids) + 1, dtype='int64')
+    numpy.cumsum(numpy.bincount(codes, minlength=len(ids)), out=offsets[1:])
+    return Grouping(numpy.asarray(ids, dtype=object), offsets, rows)
+
+
+def activity_groups(grouping):
+    """
+    Yield each activity id with its rows.
+    :param grouping: The result of group_split.
+    :return: Tuples of the activity id and the list of its row indices.
+    """
+    ids = grouping.ids.tolist()
+    offsets = grouping.offsets.tolist()
+    rows = grouping.rows.tolist()
+    for k, activityid in enumerate(ids):
+        yield activityid, rows[offsets[k]:offsets[k + 1]]
+
+
+def stream_activities(grouping, chunks):
+    """
+    Yield each activity with its rows while the source file is read in chunks.
+    An activity is yielded, in first-appearance order, as soon as its last row has
+    been read, and a chunk is dropped once all of its rows have been yielded.
+    :param grouping: The result of group_split over the whole file.
+    :param chunks: Normalized columns for consecutive slices of the file, see normalize.normalize.
+    :return: Tuples of the activity id, the columns holding its rows and the row positions in them.
+    """
+    ids = grouping.ids.tolist()
+    offsets = grouping.offsets.tolist()
+    rows = grouping.rows.tolist()
+    starts = []
+    stored = {}
+    remaining = {}
+    seen = 0
+    k = 0
+    for columns in chunks:
+        size = len(next(iter(columns.values())))
+        number = len(starts)
+        starts.append(seen)
+        stored[number] = columns
+        remaining[number] = size
+        seen += size
+
+        while k < len(ids) and rows[offsets[k + 1] - 1] < seen:
+            activityRows = rows[offsets[k]:offsets[k + 1]]
+            first = bisect.bisect_right(starts, activityRows[0]) - 1
+            if activityRows[-1] < (starts[first + 1] if first + 1 < len(starts) else seen):
+                # All rows are in one chunk, so use it directly.
+                touched = {first: len(activityRows)}
+                yield ids[k], stored[first], [row - starts[first] for row in activityRows]
+            else:
+                touched = {}
+                places = []
+                for row in activityRows:
+                    place = bisect.bisect_right(starts, row) - 1
+                    touched[place] = touched.get(place, 0) + 1
+                    places.append((stored[place], row - starts[place]))
+                gathered = {name: [chunk[name][position] for chunk, position in places] for name in columns}
+                yield ids[k], gathered, list(range(len(activityRows)))
+            for place, count in touched.items():
+                remaining[place] -= count
+                if remaining[place] == 0:
+                    del stored[place]
+            k += 1
+
+    if k < len(ids):
+        raise ValueError('The source file has fewer rows than were grouped.')
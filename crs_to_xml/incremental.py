@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from collections import deque
+
+
+# Layout of the store. Bump it when the files of a generation or the fingerprints change.
+STORE_FORMAT = 3
+
+# Modules whose code decides the serialized activities. Fragments written by other code are not reused.
+BUILDER_MODULES = ['builder.py', 'mapping.py', 'writer.py']
+
+
+def store_version(version):
+    """
+    Return the version fragments are stored under: the converter version, the store format and a hash
+    of the code that builds and serializes activities, so a changed builder rebuilds every activity.
+    :param version: The converter version.
+    :return version: The store version.
+    """
+    code = hashlib.blake2b(digest_size=8)
+    for name in BUILDER_MODULES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as sourcefile:
+            code.update(sourcefile.read())
+    return '{0}-{1}-{2}'.format(version, STORE_FORMAT, code.hexdigest())
+
+
+def fingerprint(crscolumns, activityRows):
+    """
+    Return a fingerprint of an activity's source rows.
+    Every normalized column is included, so any change to a row the activity is built from changes it.
+    The values are hashed by their repr: unlike a pickle, it is the same whether or not equal values
+    are one shared object, so rows read back from spill or cache files fingerprint like streamed rows.
+    :param crscolumns: Normalized columns, see normalize.normalize.
+    :param activityRows: Positions of the activity's rows in crscolumns.
+    :return fingerprint: 16 bytes.
+    """
+    values = [(name, [crscolumns[name][row] for row in activityRows]) for name in sorted(crscolumns)]
+    return hashlib.blake2b(repr(values).encode('utf-8'), digest_size=16).digest()
+
+
+class FingerprintStore:
+    """
+    The fingerprint and serialized iati-activity of every activity of the last run, keyed by the
+    normalized crs_id_number.
+
+    Each run writes its fragments and index to a new generation directory. manifest.json names
+    the current generation and is replaced in one step when commit is called, so a run stopped at
+    any point leaves the previous generation in use, with the index and fragments that belong together.
+    """
+
+    def __init__(self, storedir, version):
+        """
+        :param storedir: The store directory.
+        :param version: The version of the fragments, see store_version. Fragments of another version are not reused.
+        """
+        os.makedirs(storedir, exist_ok=True)
+        self.storedir = storedir
+        self.version = version
+        self.index = {}
+        self.reusable = False
+        self.generation = None
+        manifest = os.path.join(storedir, 'manifest.json')
+        if os.path.exists(manifest):
+            with open(manifest, encoding='utf-8') as manifestfile:
+                manifest = json.load(manifestfile)
+            # Stores written before generations kept their files, which may not match, in storedir itself.
+            self.generation = manifest.get('generation')
+            if self.generation is not None:
+                self.reusable = manifest['version'] == version
+                with open(os.path.join(storedir, self.generation, 'index.pickle'), 'rb') as indexfile:
+                    self.index = pickle.load(indexfile)
+        self.fragments = open(os.path.join(storedir, self.generation, 'fragments.xml'), 'rb') if self.index else None
+        self.staging = tempfile.mkdtemp(prefix='.incremental-', dir=storedir)
+        self.newindex = {}
+        self.newfragments = open(os.path.join(self.staging, 'fragments.xml'), 'wb')
+        self.added = []
+        self.changed = []
+
+    def lookup(self, activityid, activityprint):
+        """
+        Classify an activity and return its stored fragment if it can be reused.
+        :param activityid: The activity identifier.
+        :param activityprint: See fingerprint.
+        :return fragment: The serialized activity, or None when it has to be built.
+        """
+        stored = self.index.get(activityid)
+        if stored is None:
+            self.added.append(activityid)
+            return None
+        if stored[0] != activityprint:
+            self.changed.append(activityid)
+            return None
+        if not self.reusable:
+            return None
+        self.fragments.seek(stored[1])
+        return self.fragments.read(stored[2]).decode('utf-8')
+
+    def add(self, activityid, activityprint, fragment):
+        """
+        Store an activity for the next run.
+        :param activityid: The activity identifier.
+        :param activityprint: See fingerprint.
+        :param fragment: The serialized activity.
+        """
+        data = fragment.encode('utf-8')
+        self.newindex[activityid] = (activityprint, self.newfragments.tell(), len(data))
+        self.newfragments.write(data)
+
+    def removed(self):
+        """
+        :return removed: Ids of the last run that did not appear in this run.
+        """
+        return [activityid for activityid in self.index if activityid not in self.newindex]
+
+    def commit(self):
+        """
+        Replace the stored activities with the ones of this run.
+        """
+        self.newfragments.close()
+        with open(os.path.join(self.staging, 'index.pickle'), 'wb') as indexfile:
+            pickle.dump(self.newindex, indexfile, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.fragments is not None:
+            self.fragments.close()
+        # The staging directory becomes the new generation once the manifest points at it.
+        generation = os.path.basename(self.staging)
+        manifest = os.path.join(self.storedir, 'manifest.json')
+        with open(manifest + '.tmp', 'w', encoding='utf-8') as manifestfile:
+            json.dump({'version': self.version, 'generation': generation, 'activities': len(self.newindex)},
+                      manifestfile)
+        os.replace(manifest + '.tmp', manifest)
+        # Older generations, unfinished runs and the files of stores written before generations.
+        for name in os.listdir(self.storedir):
+            path = os.path.join(self.storedir, name)
+            if name in ('fragments.xml', 'index.pickle'):
+                os.remove(path)
+            elif name != generation and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def discard(self):
+        """
+        Keep the previous store and drop this run's.
+        """
+        self.newfragments.close()
+        if self.fragments is not None:
+            self.fragments.close()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+def reuse_fragments(activities, store, build):
+    """
+    Convert activities, reusing the stored fragment of every activity whose rows are unchanged.
+    :param activities: Tuples of activity id, columns and row positions, see grouping.stream_activities.
+    :param store: The FingerprintStore.
+    :param build: Function turning an iterator of activities into their fragments, in order.
+    :return: Serialized activities in input order, reused or built.
+    """
+    # Every activity, in order, with its fingerprint and the reused fragment or None.
+    plan = deque()
+
+    def to_build():
+        for activityid, crscolumns, activityRows in activities:
+            activityprint = fingerprint(crscolumns, activityRows)
+            fragment = store.lookup(activityid, activityprint)
+            plan.append((activityid, activityprint, fragment))
+            if fragment is None:
+                yield activityid, crscolumns, activityRows
+
+    built = build(to_build())
+    builtfragments = deque()
+    while True:
+        if not plan or plan[0][2] is None and not builtfragments:
+            # Pulling a built fragment also moves the plan forward.
+            fragment = next(built, None)
+            if fragment is not None:
+                builtfragments.append(fragment)
+            elif not plan:
+                return
+        activityid, activityprint, fragment = plan.popleft()
+        if fragment is None:
+            fragment = builtfragments.popleft()
+        store.add(activityid, activityprint, fragment)
+        yield fragment
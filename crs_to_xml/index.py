@@ -0,0 +1,167 @@
+import csv
+import json
+import os
+import re
+import threading
+import zlib
+from collections import namedtuple
+from xml.etree import ElementTree
+
+from .writer import start_tag, zstd_module
+
+# Fields kept for every activity in the index, and the normalized column each is read from.
+# recipient_country uses the resolved code.
+INDEX_FIELDS = {
+    'recipient_country': 'recipient_code',
+    'reporting_year': 'reporting_year',
+}
+
+# file: path of the output relative to the index. block: offset of the compressed block in the file.
+# offset, length: bytes of the activity in the uncompressed block. fields: see INDEX_FIELDS.
+IndexEntry = namedtuple('IndexEntry', ['file', 'block', 'offset', 'length', 'fields'])
+
+# Ids are looked up as grouping.group_split normalizes them, so a raw crs_id_number works too.
+NON_DIGITS = re.compile(r"\D")
+
+
+def record_activities(activities, records):
+    """
+    Pass activities through, recording the id and INDEX_FIELDS of each in order.
+    The fields are read before the activity is built, so this works the same with build_parallel.
+    :param activities: Tuples of activity id, columns and row positions, see grouping.stream_activities.
+    :param records: A deque the (activity id, fields) tuples are appended to. The activity's first row gives the fields.
+    :return: The same activities.
+    """
+    for activityid, crscolumns, activityRows in activities:
+        first = activityRows[0]
+        records.append((activityid, {name: crscolumns[column][first] for name, column in INDEX_FIELDS.items()}))
+        yield activityid, crscolumns, activityRows
+
+
+class IndexWriter:
+    """
+    Write the sidecar index: a comment line with the document settings, a header and one
+    tab-separated line per activity. Lines may be added from several threads.
+    """
+
+    def __init__(self, path, root, compression):
+        """
+        :param path: The index file.
+        :param root: Dictionary of root attributes of the indexed documents, for their namespaces.
+        :param compression: The output compression, see writer.COMPRESSIONS.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.indexfile = open(path, 'w', encoding='utf-8', newline='')
+        self.indexfile.write('# ' + json.dumps({'root': root, 'compression': compression}) + '\n')
+        self.lines = csv.writer(self.indexfile, delimiter='\t', lineterminator='\n')
+        self.lines.writerow(['id', 'file', 'block', 'offset', 'length'] + list(INDEX_FIELDS))
+
+    def add(self, activityid, filename, location, fields):
+        """
+        :param activityid: The activity identifier.
+        :param filename: The output file, relative to the index.
+        :param location: See writer.BlockFile.write.
+        :param fields: Dictionary of INDEX_FIELDS values.
+        """
+        row = [activityid, filename] + list(location) + [fields[name] or '' for name in INDEX_FIELDS]
+        with self.lock:
+            self.lines.writerow(row)
+
+    def close(self):
+        """
+        Close the index file.
+        """
+        self.indexfile.close()
+
+
+def _read_block(path, block, offset, length, compression):
+    """
+    Return the bytes of one activity.
+    :param path: The output file.
+    :param block, offset, length: See IndexEntry.
+    :param compression: The output compression.
+    :return data: The uncompressed bytes.
+    """
+    if compression == 'zip':
+        # A zip entry is a single deflate stream, so it is read from its start.
+        import zipfile
+
+        with zipfile.ZipFile(path) as archive, archive.open(archive.namelist()[0]) as entry:
+            while offset:
+                offset -= len(entry.read(min(offset, 1 << 20)))
+            return entry.read(length)
+    with open(path, 'rb') as output:
+        output.seek(block + offset if compression == 'none' else block)
+        if compression == 'none':
+            return output.read(length)
+        if compression == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            zstd, stdlib = zstd_module()
+            decompressor = zstd.ZstdDecompressor() if stdlib else zstd.ZstdDecompressor().decompressobj()
+        data = b''
+        while len(data) < offset + length and not getattr(decompressor, 'eof', False):
+            compressed = output.read(1 << 16)
+            if not compressed:
+                break
+            data += decompressor.decompress(compressed)
+        return data[offset:offset + length]
+
+
+class ActivityIndex:
+    """
+    Read single activities from a converted output through its sidecar index.
+    Looking up an activity reads only its block.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The index file, see IndexWriter.
+        """
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.entries = {}
+        with open(path, encoding='utf-8', newline='') as indexfile:
+            settings = json.loads(indexfile.readline()[2:])
+            self.root = settings['root']
+            self.compression = settings['compression']
+            lines = csv.reader(indexfile, delimiter='\t')
+            names = next(lines)[5:]
+            for line in lines:
+                self.entries[line[0]] = IndexEntry(line[1], int(line[2]), int(line[3]), int(line[4]),
+                                                   dict(zip(names, line[5:])))
+        # The namespace declarations of the root, needed to parse an activity on its own.
+        self.namespaces = {name: value for name, value in self.root.items() if name.startswith('xmlns')}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, activityid):
+        return NON_DIGITS.sub('', str(activityid)) in self.entries
+
+    def select(self, **fields):
+        """
+        Return the ids of the activities whose index fields match.
+        :param fields: Values of INDEX_FIELDS, such as recipient_country='KE'.
+        :return ids: List of activity ids, in output order.
+        """
+        return [activityid for activityid, entry in self.entries.items()
+                if all(entry.fields.get(name) == str(value) for name, value in fields.items())]
+
+    def read(self, activityid):
+        """
+        :param activityid: The activity identifier, the other-identifier ref, or the crs_id_number.
+        :return fragment: The serialized activity.
+        """
+        entry = self.entries[NON_DIGITS.sub('', str(activityid))]
+        return _read_block(os.path.join(self.directory, entry.file), entry.block, entry.offset, entry.length,
+                           self.compression).decode('utf-8')
+
+    def get(self, activityid):
+        """
+        :param activityid: The activity identifier, the other-identifier ref, or the crs_id_number.
+        :return activity: The parsed iati-activity element.
+        """
+        document = start_tag('iati-activities', self.namespaces) + self.read(activityid) + '</iati-activities>'
+        return ElementTree.fromstring(document)[0]
@@ -0,0 +1,193 @@
+import json
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+def peak_rss_mb():
+    """
+    :return peak: The peak resident memory of this process in megabytes, or None where the resource module
+                  is not available, as on Windows.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024.0 if sys.platform != 'darwin'
+                                                                 else 1024.0 * 1024.0)
+
+
+class Instrumentation:
+    """
+    Phase timers, counters, a progress line and a JSON run report.
+    When disabled, phase is a plain timer and the watch methods hand back their input untouched,
+    so the conversion loop runs exactly as it would without instrumentation.
+    """
+
+    def __init__(self, enabled=False, progress=False, interval=2.0, profile=None, tracemem=False):
+        """
+        :param enabled: Collect counters and time the streamed phases.
+        :param progress: Print a progress line to stderr, at most once per interval.
+        :param interval: Seconds between progress lines.
+        :param profile: Write cProfile statistics to this file.
+        :param tracemem: Record peak Python memory with tracemalloc.
+        """
+        self.enabled = enabled or progress or profile is not None or tracemem
+        self.progress = progress
+        self.interval = interval
+        self.profile = profile
+        self.tracemem = tracemem
+        self.started = time.time()
+        self.seconds = Counter()
+        self.counters = Counter()
+        self.extra = {}
+        self.profiler = None
+        if profile is not None:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if tracemem:
+            import tracemalloc
+
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase of the run.
+        :param name: The phase name in the report.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        """
+        :param name: The counter name in the report.
+        :param amount: Added to the counter.
+        """
+        self.counters[name] += amount
+
+    def watch_chunks(self, chunks, name='read'):
+        """
+        Time the reading of chunks and count their rows.
+        :param chunks: Normalized columns for consecutive slices of the file.
+        :param name: The phase to add the reading time to.
+        :return: The same chunks.
+        """
+        if not self.enabled:
+            return chunks
+        return self._watch_chunks(chunks, name)
+
+    def _watch_chunks(self, chunks, name):
+        """
+        Generator behind watch_chunks.
+        """
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            crscolumns = next(chunks, None)
+            self.seconds[name] += time.perf_counter() - start
+            if crscolumns is None:
+                return
+            self.counters['rows read'] += len(next(iter(crscolumns.values())))
+            yield crscolumns
+
+    def watch_fragments(self, fragments, total):
+        """
+        Count what is written and show progress.
+        :param fragments: Serialized activities, see writer.serialize_activity.
+        :param total: The number of activities expected, for the progress line.
+        :return: The same fragments.
+        """
+        if not self.enabled:
+            return fragments
+        return self._watch_fragments(fragments, total)
+
+    def _watch_fragments(self, fragments, total):
+        """
+        Generator behind watch_fragments.
+        """
+        # Progress is shown for this file when one Instrumentation times several.
+        started = time.time()
+        before = self.counters['activities emitted']
+        shown = time.monotonic()
+        for fragment in fragments:
+            activities = fragment.count('<iati-activity ')
+            self.counters['activities emitted'] += activities
+            self.counters['transactions emitted'] += fragment.count('<transaction>')
+            self.counters['crs-add dropped'] += activities - fragment.count('<crs-add>')
+            if self.progress and time.monotonic() - shown >= self.interval:
+                shown = time.monotonic()
+                self.show_progress(total, self.counters['activities emitted'] - before, started)
+            yield fragment
+        if self.progress:
+            self.show_progress(total, self.counters['activities emitted'] - before, started)
+            sys.stderr.write('\n')
+
+    def show_progress(self, total, done, started):
+        """
+        Print the progress line.
+        :param total: The number of activities expected.
+        :param done: The number of activities written.
+        :param started: When writing started.
+        """
+        elapsed = max(time.time() - started, 1e-9)
+        sys.stderr.write('\rConverted {0:,}/{1:,} activities ({2:.1%}), {3:,.0f} per second'.format(
+            done, total, done / total if total else 1, done / elapsed))
+        sys.stderr.flush()
+
+    def report(self):
+        """
+        Stop profiling and return the run report.
+        :return report: Dictionary of timings, counters and memory use.
+        """
+        report = {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'seconds': dict(self.seconds, total=time.time() - self.started),
+            'counters': dict(self.counters),
+        }
+        peak = peak_rss_mb()
+        if peak is not None:
+            report['peak_rss_mb'] = peak
+        report.update(self.extra)
+        if self.tracemem:
+            import tracemalloc
+
+            report['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+            tracemalloc.stop()
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile)
+            report['profile'] = os.path.abspath(self.profile)
+        return report
+
+    def print_report(self, log=print):
+        """
+        Stop profiling and print the timings, counters and memory use of the run.
+        :param log: Function called with each line.
+        """
+        report = self.report()
+        for name, seconds in report['seconds'].items():
+            log('{0}: {1:.2f} s'.format(name, seconds))
+        for name, count in report['counters'].items():
+            log('{0}: {1:,}'.format(name, count))
+        for name, label in (('peak_rss_mb', 'peak memory'), ('peak_traced_mb', 'peak traced memory')):
+            if name in report:
+                log('{0}: {1:.1f} MB'.format(label, report[name]))
+        if 'profile' in report:
+            log('profile: ' + report['profile'])
+
+    def write_report(self, path):
+        """
+        Write the run report as JSON.
+        :param path: The report file.
+        """
+        with open(path, 'w', encoding='utf-8') as reportfile:
+            json.dump(self.report(), reportfile, indent=2)
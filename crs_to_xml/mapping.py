@@ -0,0 +1,145 @@
+from collections import namedtuple
+from xml.etree.ElementTree import SubElement
+
+# column: the CRS column, normalized as kind (see normalize.CONVERTERS).
+# element, attrib: the element created for the value and its fixed attributes.
+# attribute: the attribute that takes the value; None puts the value in the text.
+# child: an element under element that takes the value as text, with the attributes passed to the emit function.
+# empty: 'skip' leaves out empty values, 'keep' still writes the element without the value.
+Field = namedtuple('Field', ['column', 'kind', 'element', 'attrib', 'attribute', 'child', 'empty'])
+
+
+def field(column, kind, element, attrib=None, attribute=None, child=None, empty='skip'):
+    """
+    Declare how one CRS column is written, see Field.
+    :return field: The Field.
+    """
+    return Field(column, kind, element, dict(attrib or {}), attribute, child, empty)
+
+
+# Activity fields, taken from the first row of the activity. Written in this order.
+ACTIVITY_FIELDS = [
+    # policy-marker code=1-9
+    field('gender_equity', 'code', 'policy-marker', {'code': '1', 'vocabulary': '1'}, 'significance'),
+    field('aid_to_environment', 'code', 'policy-marker', {'code': '2', 'vocabulary': '1'}, 'significance'),
+    field('pd_GG', 'code', 'policy-marker', {'code': '3', 'vocabulary': '1'}, 'significance'),
+    field('Trade_Development', 'code', 'policy-marker', {'code': '4', 'vocabulary': '1'}, 'significance'),
+    field('biodiversity', 'code', 'policy-marker', {'code': '5', 'vocabulary': '1'}, 'significance'),
+    field('mitigation', 'code', 'policy-marker', {'code': '6', 'vocabulary': '1'}, 'significance'),
+    field('adaptation', 'code', 'policy-marker', {'code': '7', 'vocabulary': '1'}, 'significance'),
+    field('desertification', 'code', 'policy-marker', {'code': '8', 'vocabulary': '1'}, 'significance'),
+    field('RMNCH', 'code', 'policy-marker', {'code': '9', 'vocabulary': '1'}, 'significance'),
+    field('bi_multi', 'code', 'collaboration-type', attribute='code'),
+    field('flow_type', 'code', 'default-flow-type', attribute='code'),
+    field('finance_type', 'code', 'default-finance-type', attribute='code'),
+    field('dac_typology', 'text', 'default-aid-type', attribute='code'),
+]
+
+# crs-add other-flags, taken from the first row of the activity that has a value.
+FLAG_FIELDS = [
+    field('FTC', 'code', 'other-flags', {'code': '1'}, 'significance'),
+    field('Programme_based_approach', 'code', 'other-flags', {'code': '2'}, 'significance'),
+    field('investment_project', 'code', 'other-flags', {'code': '3'}, 'significance'),
+    field('AF', 'code', 'other-flags', {'code': '4'}, 'significance'),
+]
+
+# crs-add dac:other-amounts, one per row with a value. The dac:value gets the row's value-date.
+OTHER_AMOUNT_FIELDS = [
+    field('irtc', 'number', 'dac:other-amounts', {'code': '1'}, child='dac:value'),
+    field('expert_commitment', 'number', 'dac:other-amounts', {'code': '2'}, child='dac:value'),
+    field('expert_extended', 'number', 'dac:other-amounts', {'code': '3'}, child='dac:value'),
+    field('export_credit', 'number', 'dac:other-amounts', {'code': '4'}, child='dac:value'),
+]
+
+# crs-add fields that appear once, taken from the first row of the activity that has a value.
+CRS_ADD_FIELDS = [
+    field('channel_code', 'code', 'channel-code'),
+    field('channel_name', 'text', 'dac:channel-description', child='narrative'),
+    field('reporting_year', 'code', 'dac:reporting-year'),
+    field('reporting_country', 'code', 'dac:donorcode', attribute='code'),
+    field('extending_agency', 'code', 'dac:agency', attribute='code'),
+    field('nature_of_submission', 'code', 'dac:nature-submission', attribute='code'),
+    field('commitment_date', 'date', 'dac:commitment-date', attribute='iso-date'),
+    field('currency', 'code', 'dac:currency', attribute='code'),
+]
+
+FIELDS = ACTIVITY_FIELDS + FLAG_FIELDS + OTHER_AMOUNT_FIELDS + CRS_ADD_FIELDS
+
+
+def _first(values, rows):
+    """
+    Return the first value that is not None.
+    :param values: A normalized column.
+    :param rows: Row positions to look at, in order.
+    :return value: The value, or None.
+    """
+    for row in rows:
+        if values[row] is not None:
+            return values[row]
+    return None
+
+
+def any_value(crscolumns, columns, rows):
+    """
+    Return True if any of the columns has a value in any of the rows.
+    :param crscolumns: Normalized columns, see normalize.normalize.
+    :param columns: Column names.
+    :param rows: Row positions to look at.
+    :return present: True or False.
+    """
+    for column in columns:
+        values = crscolumns[column]
+        for row in rows:
+            if values[row] is not None:
+                return True
+    return False
+
+
+def _element_lines(spec, target):
+    """
+    Return the source lines that write one field whose value is in the local "value".
+    :param spec: The Field.
+    :param target: The source expression of the parent element.
+    :return lines: Lines of the emit function, indented for the "if value is not None" block.
+    """
+    if spec.attribute is not None:
+        attrib = '{' + ''.join('{0!r}: {1!r}, '.format(name, text) for name, text in spec.attrib.items()) + \
+                 '{0!r}: value}}'.format(spec.attribute)
+        return ['SubElement({0}, {1!r}, {2})'.format(target, spec.element, attrib)]
+    lines = ['element = SubElement({0}, {1!r}, {2!r})'.format(target, spec.element, spec.attrib)]
+    if spec.child is not None:
+        lines.append('element = SubElement(element, {0!r}, childattrib)'.format(spec.child))
+    lines.append('element.text = value')
+    return lines
+
+
+def compile_fields(fields, reduce='row'):
+    """
+    Compile a field table into a function that writes the fields of one activity.
+    The table is turned into straight-line Python once, so writing an activity does
+    no table lookups.
+    :param fields: List of Field.
+    :param reduce: 'row' writes the fields of a single row, emit(parent, crscolumns, row, childattrib=None).
+                   'first' writes the first value of each field over the activity's rows,
+                   emit(parent, crscolumns, rows, childattrib=None).
+    :return emit: The compiled function.
+    """
+    lines = ['def emit(parent, crscolumns, {0}, childattrib=None):'.format('row' if reduce == 'row' else 'rows')]
+    if any(spec.child is not None for spec in fields):
+        lines.append('    childattrib = childattrib or {}')
+    for spec in fields:
+        if reduce == 'row':
+            lines.append('    value = crscolumns[{0!r}][row]'.format(spec.column))
+        else:
+            lines.append('    value = _first(crscolumns[{0!r}], rows)'.format(spec.column))
+        lines.append('    if value is not None:')
+        lines.extend('        ' + line for line in _element_lines(spec, 'parent'))
+        if spec.empty == 'keep':
+            lines.append('    else:')
+            lines.append('        SubElement(parent, {0!r}, {1!r})'.format(spec.element, spec.attrib))
+    lines.append('    return parent')
+    namespace = {'SubElement': SubElement, '_first': _first}
+    exec(compile('\n'.join(lines) + '\n', '<mapping {0}>'.format(reduce), 'exec'), namespace)
+    emit = namespace['emit']
+    emit.source = '\n'.join(lines)
+    return emit
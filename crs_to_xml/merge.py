@@ -0,0 +1,128 @@
+import csv
+import os
+
+from .mapping import ACTIVITY_FIELDS
+
+# How rows of an activity found in several files are combined.
+# latest: only the rows of the last file the activity is in, for amended files given after the originals.
+# union: the rows of every file, leaving out rows that repeat a row of an earlier file.
+POLICIES = ('latest', 'union')
+
+# Columns the builder takes from an activity's first row. Files that disagree on one of them are a conflict.
+CONFLICT_COLUMNS = ['project_title', 'description', 'start_date', 'completion_date', 'geographical_target',
+                    'recipient_code', 'purpose_code'] + [spec.column for spec in ACTIVITY_FIELDS]
+
+
+class Merger:
+    """
+    Combine the rows of activities that appear in several source files.
+    The files are read one after another as one source, so the grouping of their ids is the index
+    of every activity across files, and an activity in several files is found from the first and
+    last file of its rows without comparing ids again.
+    """
+
+    def __init__(self, files, fileoffsets, grouping, policy='latest'):
+        """
+        :param files: The source files, in the order they were read.
+        :param fileoffsets: Position of the first row of each file and, last, the total number of rows.
+        :param grouping: The grouping of the ids of all files, see grouping.group_split.
+        :param policy: See POLICIES.
+        """
+        import numpy
+
+        if policy not in POLICIES:
+            raise ValueError('Unknown merge policy: {0}'.format(policy))
+        self.files = [os.path.basename(filetoopen) for filetoopen in files]
+        self.fileoffsets = numpy.asarray(fileoffsets)
+        self.grouping = grouping
+        self.policy = policy
+        # The file of every grouped row. Rows are in source order within an activity, so files are too.
+        self.rowfiles = numpy.searchsorted(self.fileoffsets, grouping.rows, side='right') - 1
+        counts = numpy.diff(grouping.offsets)
+        first = self.rowfiles[grouping.offsets[:-1][counts > 0]]
+        last = self.rowfiles[grouping.offsets[1:][counts > 0] - 1]
+        self.duplicated = numpy.zeros(len(grouping.ids), dtype=bool)
+        self.duplicated[counts > 0] = first != last
+        # Tuples of activity id, file names, rows kept per file and the conflicting columns.
+        self.duplicates = []
+        # Position of each duplicated activity in the grouping: its source rows the policy kept.
+        self.keptrows = {}
+        self.dropped = 0
+
+    def merge(self, activities):
+        """
+        Apply the policy to activities in grouping order and record duplicates and conflicts.
+        Activities found in one file pass untouched.
+        :param activities: Tuples of activity id, columns and row positions, see grouping.stream_activities.
+        :return: The same tuples, with the rows the policy keeps.
+        """
+        offsets = self.grouping.offsets
+        for k, (activityid, crscolumns, activityRows) in enumerate(activities):
+            if not self.duplicated[k]:
+                yield activityid, crscolumns, activityRows
+                continue
+            rowfiles = self.rowfiles[offsets[k]:offsets[k + 1]].tolist()
+            # The first row of each file, in file order.
+            firsts = {}
+            for row, rowfile in zip(activityRows, rowfiles):
+                firsts.setdefault(rowfile, row)
+            conflicts = [name for name in CONFLICT_COLUMNS
+                         if name in crscolumns and len({crscolumns[name][row] for row in firsts.values()}) > 1]
+            if self.policy == 'latest':
+                latest = rowfiles[-1]
+                kept = [row for row, rowfile in zip(activityRows, rowfiles) if rowfile == latest]
+            else:
+                kept = self._union(crscolumns, activityRows, rowfiles)
+            self.dropped += len(activityRows) - len(kept)
+            keptset = set(kept)
+            keptfiles = [rowfile for row, rowfile in zip(activityRows, rowfiles) if row in keptset]
+            sourcerows = self.grouping.rows[offsets[k]:offsets[k + 1]].tolist()
+            self.keptrows[k] = [source for row, source in zip(activityRows, sourcerows) if row in keptset]
+            self.duplicates.append((activityid, [self.files[rowfile] for rowfile in firsts],
+                                    [keptfiles.count(rowfile) for rowfile in firsts], conflicts))
+            yield activityid, crscolumns, kept
+
+    @staticmethod
+    def _union(crscolumns, activityRows, rowfiles):
+        """
+        Return the rows of every file, without the rows that repeat a row of an earlier file.
+        Repeats within one file are kept, as they are separate transactions.
+        :param crscolumns: The columns holding the rows.
+        :param activityRows: Positions of the activity's rows in crscolumns.
+        :param rowfiles: The file of each row.
+        :return kept: The positions kept.
+        """
+        names = sorted(crscolumns)
+        earlier = set()
+        current = set()
+        currentfile = rowfiles[0]
+        kept = []
+        for row, rowfile in zip(activityRows, rowfiles):
+            if rowfile != currentfile:
+                earlier |= current
+                current = set()
+                currentfile = rowfile
+            values = tuple(crscolumns[name][row] for name in names)
+            if values in earlier:
+                continue
+            current.add(values)
+            kept.append(row)
+        return kept
+
+    def conflicting(self):
+        """
+        :return count: The number of duplicated activities whose files disagree.
+        """
+        return sum(1 for duplicate in self.duplicates if duplicate[3])
+
+    def write_report(self, path):
+        """
+        Write the duplicated activities as tab-separated lines: id, files, rows kept per file and conflicting columns.
+        :param path: The report file.
+        """
+        with open(path, 'w', encoding='utf-8', newline='') as reportfile:
+            lines = csv.writer(reportfile, delimiter='\t', lineterminator='\n')
+            lines.writerow(['id', 'files', 'rows kept', 'conflicts'])
+            for activityid, files, kept, conflicts in self.duplicates:
+                lines.writerow([activityid, ' '.join(files), ' '.join(str(count) for count in kept),
+                                ' '.join(conflicts)])
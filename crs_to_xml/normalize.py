@@ -0,0 +1,208 @@
+import numpy
+import pandas
+
+from .dates import iso_dates, to_dates, to_years
+from .mapping import FIELDS
+
+
+def _finish(values, mask):
+    """
+    Return a plain list with None wherever the mask is False.
+    :param values: Array of converted values, only trusted where the mask is True.
+    :param mask: Boolean array marking the cells that hold data.
+    :return column: A list of ready-to-emit values or None.
+    """
+    column = numpy.full(len(mask), None, dtype=object)
+    column[mask] = values
+    return column.tolist()
+
+
+def code_column(series):
+    """
+    Return integer code strings, the vectorized form of str(int(cell)).
+    :param series: The source column.
+    :return column: A list of code strings or None.
+    """
+    numbers = pandas.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=numpy.nan)
+    mask = numpy.isfinite(numbers)
+    codes = numpy.trunc(numbers[mask]).astype('int64').astype(str)
+    return _finish(codes, mask)
+
+
+def amount_column(series):
+    """
+    Return amounts formatted with two decimals, the vectorized form of '{0:.2f}'.format(float(cell)).
+    :param series: The source column.
+    :return column: A list of amount strings or None.
+    """
+    numbers = pandas.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=numpy.nan)
+    mask = ~numpy.isnan(numbers)
+    amounts = numpy.char.mod('%.2f', numbers[mask])
+    return _finish(amounts, mask)
+
+
+def number_column(series):
+    """
+    Return unformatted number strings, the vectorized form of str(float(cell)).
+    :param series: The source column.
+    :return column: A list of number strings or None.
+    """
+    numbers = pandas.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=numpy.nan)
+    mask = ~numpy.isnan(numbers)
+    return _finish([str(number) for number in numbers[mask].tolist()], mask)
+
+
+def text_column(series):
+    """
+    Return cell text, the vectorized form of str(cell) with blanks and 'nan' dropped.
+    :param series: The source column.
+    :return column: A list of strings or None.
+    """
+    text = series.astype(str)
+    mask = (series.notna() & (text != '') & (text != 'nan')).to_numpy()
+    return _finish(text.to_numpy()[mask], mask)
+
+
+def date_column(series):
+    """
+    Return ISO dates from dates, timestamps, Excel serials or text, see dates.to_dates.
+    :param series: The source column.
+    :return column: A list of YYYY-MM-DD strings or None, also for cells that are not a date.
+    """
+    mask, dates = iso_dates(to_dates(series))
+    return _finish(dates, mask)
+
+
+def year_column(series):
+    """
+    Return the first day of the year in a year column as an ISO date.
+    :param series: The source column, holding years such as 2017.
+    :return column: A list of YYYY-01-01 strings or None.
+    """
+    mask, dates = iso_dates(to_years(series))
+    return _finish(dates, mask)
+
+
+# Converters by the kind named in the mapping tables, see mapping.Field.
+CONVERTERS = {
+    'code': code_column,
+    'amount': amount_column,
+    'number': number_column,
+    'text': text_column,
+    'date': date_column,
+    'year': year_column,
+}
+
+# Every column the converter reads, and how its cells become output values.
+COLUMNS = {
+    'project_title': text_column,
+    'description': text_column,
+    'start_date': date_column,
+    'completion_date': date_column,
+    'geographical_target': text_column,
+    'recipient_country': text_column,
+    'purpose_code': code_column,
+    'Interest_rate': number_column,
+    'Second_interest_rate': number_column,
+    'Type': code_column,
+    'No_repayments': code_column,
+    'First_repay_date': date_column,
+    'Final_repay_date': date_column,
+    'grant_equivalent': amount_column,
+    'interest_received': amount_column,
+    'Principa_disbursed': amount_column,
+    'Principal_arrears': amount_column,
+    'arrears_interest': amount_column,
+    'Leverage_mech': code_column,
+    'Orgin_of_funds': code_column,
+    'Amounts_mobilized': amount_column,
+}
+# Columns written through the mapping tables.
+COLUMNS.update((spec.column, CONVERTERS[spec.kind]) for spec in FIELDS)
+
+# Fallback chains. Each row takes the amount of the first column in the chain that has one,
+# with that column's code. normalize adds them as "<name>_amount" and "<name>_code".
+CHAINS = {
+    # transaction-type 3 disbursement, 2 commitment, 6 repayment
+    'transaction': [('amt_extended', '3'), ('commitments', '2'), ('amt_received', '6'), ('interest_received', '6')],
+    # dac:tied-status 5 untied, 3 partially tied, 4 tied
+    'tied': [('amt_untied', '5'), ('amt_partial', '3'), ('amt_tied', '4')],
+}
+
+# Dates of every transaction. Each row takes the date of the first column in the chain that has one,
+# read as the kind of date given, see CONVERTERS. normalize adds them under their name.
+DATES = {
+    # transaction-date iso-date
+    'transaction_date': [('reporting_year', 'year'), ('commitment_date', 'date')],
+    # value-date of the transaction value and of dac:tied-status. Put ('commitment_date', 'date') first
+    # to value amounts at the commitment date where there is one.
+    'value_date': [('reporting_year', 'year'), ('commitment_date', 'date')],
+}
+
+# Date of the rows where no column of a date chain has one, as YYYY-MM-DD. None leaves those rows
+# without the date, although the schema requires both; the converter counts and logs them.
+DEFAULT_DATE = None
+
+# Every source column the converter reads.
+SOURCE_COLUMNS = sorted(set(COLUMNS).union(name for chain in CHAINS.values() for name, code in chain)
+                        .union(name for chain in DATES.values() for name, kind in chain))
+
+
+def coalesce_column(crs, chain):
+    """
+    Return the amount and code columns of a fallback chain.
+    :param crs: The crs DataFrame.
+    :param chain: List of (column name, code), in order of preference. Missing columns are skipped.
+    :return amounts, codes: Lists of amount strings and codes, both None where no column has a value.
+    """
+    numbers = numpy.full(len(crs), numpy.nan)
+    codes = numpy.full(len(crs), None, dtype=object)
+    for name, code in chain:
+        if name not in crs:
+            continue
+        values = pandas.to_numeric(crs[name], errors='coerce').to_numpy(dtype='float64', na_value=numpy.nan)
+        fill = numpy.isnan(numbers) & ~numpy.isnan(values)
+        numbers[fill] = values[fill]
+        codes[fill] = code
+    mask = ~numpy.isnan(numbers)
+    return _finish(numpy.char.mod('%.2f', numbers[mask]), mask), codes.tolist()
+
+
+def coalesce_dates(crs, chain):
+    """
+    Return the date column of a date chain.
+    :param crs: The crs DataFrame.
+    :param chain: List of (column name, kind of date), in order of preference. Missing columns are skipped.
+    :return column: A list of YYYY-MM-DD strings. Where no column has a date, DEFAULT_DATE or None.
+    """
+    dates = numpy.full(len(crs), numpy.datetime64('NaT', 'D'))
+    for name, kind in chain:
+        if name not in crs:
+            continue
+        values = to_years(crs[name]) if kind == 'year' else to_dates(crs[name].reset_index(drop=True))
+        fill = numpy.isnat(dates) & ~numpy.isnat(values)
+        dates[fill] = values[fill]
+    if DEFAULT_DATE is not None:
+        dates[numpy.isnat(dates)] = numpy.datetime64(DEFAULT_DATE, 'D')
+    mask, text = iso_dates(dates)
+    return _finish(text, mask)
+
+
+def normalize(crs):
+    """
+    Convert every column the converter reads into a list of ready-to-emit values.
+    Each column is converted once, so the main loop only indexes plain lists.
+    :param crs: The crs DataFrame.
+    :return columns: Dictionary of column name to list of values, None for empty cells.
+    """
+    columns = {}
+    for name, convert in COLUMNS.items():
+        if name in crs:
+            columns[name] = convert(crs[name].reset_index(drop=True))
+        else:
+            columns[name] = [None] * len(crs)
+    for name, chain in CHAINS.items():
+        columns[name + '_amount'], columns[name + '_code'] = coalesce_column(crs, chain)
+    for name, chain in DATES.items():
+        columns[name] = coalesce_dates(crs, chain)
+    return columns
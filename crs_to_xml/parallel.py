@@ -0,0 +1,72 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+from .builder import build_activity
+from .writer import serialize_activity
+
+# Source rows per task sent to a worker.
+BATCH_ROWS = 2000
+
+
+def build_batch(crscolumns, batch, date):
+    """
+    Build and serialize a batch of activities. Runs in a worker process.
+    :param crscolumns: Normalized columns holding the rows of the batch.
+    :param batch: List of activity ids and row positions in crscolumns.
+    :param date: The timestamp for last-updated-datetime.
+    :return fragments: The serialized activities, in batch order.
+    """
+    return [serialize_activity(build_activity(crscolumns, activityid, activityRows, date))
+            for activityid, activityRows in batch]
+
+
+def make_batches(activities, batchrows=BATCH_ROWS):
+    """
+    Group consecutive activities into tasks, each carrying only the rows it needs.
+    :param activities: Tuples of activity id, columns and row positions, see grouping.stream_activities.
+    :param batchrows: Close a batch once it holds this many rows.
+    :return: Tuples of the gathered columns and the activities with positions in them.
+    """
+    batch = []
+    size = 0
+    for activityid, crscolumns, activityRows in activities:
+        if not batch:
+            gathered = {name: [] for name in crscolumns}
+        getter = itemgetter(*activityRows)
+        for name, values in crscolumns.items():
+            if len(activityRows) == 1:
+                gathered[name].append(getter(values))
+            else:
+                gathered[name].extend(getter(values))
+        batch.append((activityid, list(range(size, size + len(activityRows)))))
+        size += len(activityRows)
+        if size >= batchrows:
+            yield gathered, batch
+            batch = []
+            size = 0
+    if batch:
+        yield gathered, batch
+
+
+def build_parallel(activities, date, workers, pool=None):
+    """
+    Build activities across a pool of processes, yielding the fragments in input order.
+    At most two tasks per worker are in flight, so the reader never runs far ahead.
+    :param activities: Tuples of activity id, columns and row positions, see grouping.stream_activities.
+    :param date: The timestamp for last-updated-datetime.
+    :param workers: Number of worker processes.
+    :param pool: Optional ProcessPoolExecutor to reuse. Without one, a pool is started and stopped for this call.
+    :return: Serialized activities, in the same order as single-process output.
+    """
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from build_parallel(activities, date, workers, pool)
+        return
+    pending = deque()
+    for crscolumns, batch in make_batches(activities):
+        pending.append(pool.submit(build_batch, crscolumns, batch, date))
+        if len(pending) >= workers * 2:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
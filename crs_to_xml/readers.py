@@ -0,0 +1,183 @@
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+
+import pandas
+
+# Rows per chunk when streaming the source file.
+CHUNKSIZE = 50000
+
+
+def _xlsx_rows(filetoopen, skipped=None):
+    """
+    Yield the header and then every non-blank row of the first worksheet.
+    The workbook is opened read-only, so rows are parsed as they are reached.
+    :param filetoopen: Path to the .xlsx file.
+    :param skipped: Optional list the worksheet row numbers of blank rows are appended to, the header being row 1.
+    :return: Tuples of cell values, the header first.
+    """
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(filetoopen, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        yield next(rows, ())
+        for number, row in enumerate(rows, 2):
+            if any(cell is not None for cell in row):
+                yield row
+            elif skipped is not None:
+                skipped.append(number)
+    finally:
+        workbook.close()
+
+
+def _separator(filetoopen):
+    """
+    Return the field separator for a delimited file.
+    :param filetoopen: Path to the .csv or .tsv file.
+    :return sep: The separator.
+    """
+    return '\t' if filetoopen.lower().endswith(('.tsv', '.tab')) else ','
+
+
+def file_kind(filetoopen):
+    """
+    Return how a source file is read.
+    :param filetoopen: Path to the source file.
+    :return kind: 'xlsx', 'csv' or 'excel' for any other workbook pandas can read.
+    """
+    extension = os.path.splitext(filetoopen)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        return 'xlsx'
+    if extension in ('.csv', '.tsv', '.tab', '.txt'):
+        return 'csv'
+    return 'excel'
+
+
+def read_header(filetoopen):
+    """
+    Return the column names of the source file.
+    :param filetoopen: Path to the source file.
+    :return header: List of column names.
+    """
+    kind = file_kind(filetoopen)
+    if kind == 'xlsx':
+        rows = _xlsx_rows(filetoopen)
+        header = list(next(rows))
+        rows.close()
+        return header
+    if kind == 'csv':
+        return list(pandas.read_csv(filetoopen, sep=_separator(filetoopen), nrows=0))
+    return list(pandas.read_excel(filetoopen, nrows=0))
+
+
+def blank_lines(filetoopen):
+    """
+    Return the line numbers of the blank lines of a delimited file, which pandas skips.
+    :param filetoopen: Path to the .csv or .tsv file.
+    :return skipped: List of line numbers, the header being line 1.
+    """
+    with open(filetoopen, encoding='utf-8', errors='replace', newline='') as source:
+        return [number for number, line in enumerate(source, 1) if not line.strip('\r\n')]
+
+
+def read_chunks(filetoopen, columns, chunksize=CHUNKSIZE, skipped=None):
+    """
+    Yield the source file in DataFrames of at most chunksize rows.
+    Only the requested columns are kept; requested columns missing from the file are left out.
+    :param filetoopen: Path to the source file.
+    :param columns: The column names to load.
+    :param chunksize: Maximum rows per chunk.
+    :param skipped: Optional list the row numbers of blank rows of a worksheet are appended to, see _xlsx_rows.
+    :return: DataFrames with a RangeIndex that continues across chunks.
+    """
+    wanted = set(columns)
+    kind = file_kind(filetoopen)
+    if kind == 'xlsx':
+        rows = _xlsx_rows(filetoopen, skipped)
+        header = next(rows)
+        keep = [k for k, name in enumerate(header) if name in wanted]
+        names = [header[k] for k in keep]
+        start = 0
+        chunk = []
+        for row in rows:
+            chunk.append([row[k] if k < len(row) else None for k in keep])
+            if len(chunk) == chunksize:
+                yield pandas.DataFrame(chunk, columns=names, index=pandas.RangeIndex(start, start + len(chunk)))
+                start += len(chunk)
+                chunk = []
+        if chunk or start == 0:
+            yield pandas.DataFrame(chunk, columns=names, index=pandas.RangeIndex(start, start + len(chunk)))
+    elif kind == 'csv':
+        # Ids are kept as text so every chunk strips them the same way.
+        for chunk in pandas.read_csv(filetoopen, sep=_separator(filetoopen), usecols=lambda name: name in wanted,
+                                     dtype={'crs_id_number': str}, chunksize=chunksize):
+            yield chunk
+    else:
+        crs = pandas.read_excel(filetoopen, usecols=lambda name: name in wanted)
+        for start in range(0, max(len(crs), 1), chunksize):
+            yield crs.iloc[start:start + chunksize]
+
+
+def read_ids(filetoopen, chunksize=CHUNKSIZE, skipped=None):
+    """
+    Return the crs_id_number column, read on its own ahead of the full pass.
+    :param filetoopen: Path to the source file.
+    :param chunksize: Maximum rows held at a time while reading.
+    :param skipped: Optional list the row numbers of skipped blank rows are appended to.
+    :return ids: The crs_id_number values in row order.
+    """
+    if skipped is not None and file_kind(filetoopen) == 'csv':
+        skipped.extend(blank_lines(filetoopen))
+    ids = []
+    for chunk in read_chunks(filetoopen, ['crs_id_number'], chunksize, skipped):
+        if 'crs_id_number' not in chunk:
+            raise KeyError('crs_id_number')
+        ids.extend(chunk['crs_id_number'].tolist())
+    return ids
+
+
+def spool_chunks(filetoopen, columns, prepare, spooldir=None, chunksize=CHUNKSIZE, skipped=None):
+    """
+    Read the crs_id_number column and the prepared chunks of the source file in a single pass.
+    Workbooks cannot be read one column at a time, so instead of reading them twice the prepared
+    chunks are kept in temporary files until they are asked for.
+    :param filetoopen: Path to the source file.
+    :param columns: The column names to load, besides crs_id_number.
+    :param prepare: Function applied to each DataFrame chunk before it is stored, such as normalize.normalize.
+    :param spooldir: Directory for the temporary files, the system temporary directory by default.
+    :param chunksize: Maximum rows per chunk.
+    :param skipped: Optional list the row numbers of skipped blank rows are appended to.
+    :return ids: The crs_id_number values in row order.
+    :return chunks: The prepared chunks, read back one at a time. Each file is removed once read.
+    """
+    ids = []
+    directory = tempfile.mkdtemp(prefix='crs-spool-', dir=spooldir)
+    count = 0
+    try:
+        for chunk in read_chunks(filetoopen, list(columns) + ['crs_id_number'], chunksize, skipped):
+            if 'crs_id_number' not in chunk:
+                raise KeyError('crs_id_number')
+            ids.extend(chunk['crs_id_number'].tolist())
+            with open(os.path.join(directory, '{0:05d}.pickle'.format(count)), 'wb') as spoolfile:
+                pickle.dump(prepare(chunk), spoolfile, protocol=pickle.HIGHEST_PROTOCOL)
+            count += 1
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    def chunks():
+        for number in range(count):
+            path = os.path.join(directory, '{0:05d}.pickle'.format(number))
+            with open(path, 'rb') as spoolfile:
+                chunk = pickle.load(spoolfile)
+            os.remove(path)
+            yield chunk
+        shutil.rmtree(directory, ignore_errors=True)
+
+    spooled = chunks()
+    # Also removes the files when the chunks are dropped unread, such as after an error.
+    weakref.finalize(spooled, shutil.rmtree, directory, True)
+    return ids, spooled
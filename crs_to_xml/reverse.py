@@ -0,0 +1,301 @@
+import json
+import os
+from collections import namedtuple
+from xml.etree import ElementTree
+
+from .mapping import ACTIVITY_FIELDS, CRS_ADD_FIELDS, FLAG_FIELDS, OTHER_AMOUNT_FIELDS
+from .writer import zstd_module
+
+DAC = '{http://www.oecd.org/dac/}'
+
+# Activity columns, one value per activity, in table order. The builder takes them from the activity's
+# first row, or the first row with a value for the crs-add fields.
+BASE_COLUMNS = ['project_title', 'description', 'start_date', 'completion_date', 'geographical_target']
+LOAN_TERM_COLUMNS = ['Interest_rate', 'Second_interest_rate', 'Type', 'No_repayments', 'First_repay_date',
+                     'Final_repay_date']
+ACTIVITY_COLUMNS = BASE_COLUMNS + [spec.column for spec in ACTIVITY_FIELDS + FLAG_FIELDS + CRS_ADD_FIELDS] + \
+    LOAN_TERM_COLUMNS
+
+# Repeated elements, one entry per source row that has them, and the columns of each entry.
+# The transaction columns are the normalized ones, see normalize.CHAINS and normalize.DATES.
+GROUPS = {
+    'transaction': ['transaction_code', 'transaction_date', 'value_date', 'transaction_amount', 'recipient_code',
+                    'purpose_code', 'tied_code', 'tied_amount'],
+    'grant_equivalent': ['grant_equivalent'],
+    'loan_status': ['commitment_date', 'reporting_year', 'interest_received', 'Principa_disbursed',
+                    'Principal_arrears', 'arrears_interest'],
+    # column: the CRS column of the amount, see mapping.OTHER_AMOUNT_FIELDS.
+    'other_amounts': ['column', 'value', 'commitment_date'],
+    'mobilisation': ['Leverage_mech', 'Orgin_of_funds', 'Amounts_mobilized'],
+}
+
+# Where the activity columns are read from: the activity's first row, or the first row with a value.
+# The loan terms all come from the first row with a rate.
+FIRST_ROW_COLUMNS = BASE_COLUMNS + [spec.column for spec in ACTIVITY_FIELDS]
+FIRST_VALUE_COLUMNS = [spec.column for spec in FLAG_FIELDS + CRS_ADD_FIELDS]
+RATE_COLUMNS = LOAN_TERM_COLUMNS[:2]
+
+# Groups with one entry per row that has a value in one of these columns. other_amounts has one entry
+# per value of a mapping.OTHER_AMOUNT_FIELDS column instead.
+ENTRY_COLUMNS = {
+    'transaction': ['transaction_amount'],
+    'grant_equivalent': ['grant_equivalent'],
+    'loan_status': GROUPS['loan_status'][2:],
+    'mobilisation': GROUPS['mobilisation'],
+}
+
+# crs-add groups, and the columns that decide it, only written for activities with other-flags.
+CRS_ADD_GROUPS = ['grant_equivalent', 'loan_status', 'other_amounts', 'mobilisation']
+FLAG_COLUMNS = [spec.column for spec in FLAG_FIELDS]
+
+# fields: values in ACTIVITY_COLUMNS order. groups: lists of tuples in GROUPS order.
+Record = namedtuple('Record', ['id', 'fields', 'groups'])
+
+LOAN_STATUS_AMOUNTS = {'interest-received': 'interest_received', 'principal-outstanding': 'Principa_disbursed',
+                       'principal-arrears': 'Principal_arrears', 'interest-arrears': 'arrears_interest'}
+
+
+def _tag(element):
+    """
+    :param element: A mapping element name, such as dac:currency.
+    :return tag: The name as the parser reports it.
+    """
+    return DAC + element[4:] if element.startswith('dac:') else element
+
+
+def _field_lookup(fields):
+    """
+    Index a field table by the parsed tag of its elements.
+    :param fields: List of mapping.Field.
+    :return lookup: Dictionary of tag to list of (Field, position in ACTIVITY_COLUMNS or None).
+    """
+    lookup = {}
+    for spec in fields:
+        column = ACTIVITY_COLUMNS.index(spec.column) if spec.column in ACTIVITY_COLUMNS else None
+        lookup.setdefault(_tag(spec.element), []).append((spec, column))
+    return lookup
+
+
+ACTIVITY_LOOKUP = _field_lookup(ACTIVITY_FIELDS)
+CRS_ADD_LOOKUP = _field_lookup(FLAG_FIELDS + CRS_ADD_FIELDS)
+OTHER_AMOUNT_LOOKUP = _field_lookup(OTHER_AMOUNT_FIELDS)
+COLUMN = {column: k for k, column in enumerate(ACTIVITY_COLUMNS)}
+
+
+def _match(lookup, element):
+    """
+    Return the field an element was written for.
+    :param lookup: See _field_lookup.
+    :param element: A parsed element.
+    :return spec, column: The Field and its position in ACTIVITY_COLUMNS, or (None, None).
+    """
+    for spec, column in lookup.get(element.tag, ()):
+        if all(element.get(name) == text for name, text in spec.attrib.items()):
+            return spec, column
+    return None, None
+
+
+def _value(spec, element):
+    """
+    :param spec: The Field.
+    :param element: The element written for it.
+    :return value: The value written.
+    """
+    if spec.attribute is not None:
+        return element.get(spec.attribute)
+    if spec.child is not None:
+        child = element.find(_tag(spec.child))
+        return child.text if child is not None else None
+    return element.text
+
+
+def _narrative(element):
+    """
+    :param element: An element with a narrative, or None.
+    :return text: The text of the first narrative, or None.
+    """
+    if element is None:
+        return None
+    narrative = element.find('narrative')
+    return narrative.text if narrative is not None else None
+
+
+def parse_activity(activity):
+    """
+    Read one iati-activity back into the CRS values it was built from.
+    :param activity: The iati-activity element.
+    :return record: The Record.
+    """
+    fields = [None] * len(ACTIVITY_COLUMNS)
+    groups = {name: [] for name in GROUPS}
+    identifier = activity.find('other-identifier')
+    activityid = identifier.get('ref') if identifier is not None else None
+    starts = {'1': COLUMN['start_date'], '3': COLUMN['completion_date']}
+    for element in activity:
+        tag = element.tag
+        if tag == 'title':
+            fields[COLUMN['project_title']] = _narrative(element)
+        elif tag == 'description':
+            fields[COLUMN['description']] = _narrative(element)
+        elif tag == 'activity-date' and element.get('type') in starts:
+            fields[starts[element.get('type')]] = element.get('iso-date')
+        elif tag == 'location':
+            fields[COLUMN['geographical_target']] = _narrative(element.find('name'))
+        elif tag == 'transaction':
+            groups['transaction'].append(_parse_transaction(element))
+        elif tag == 'crs-add':
+            _parse_crs_add(element, fields, groups)
+        else:
+            spec, column = _match(ACTIVITY_LOOKUP, element)
+            if spec is not None:
+                fields[column] = _value(spec, element)
+    return Record(activityid, tuple(fields), tuple(groups[name] for name in GROUPS))
+
+
+def _parse_transaction(transaction):
+    """
+    :param transaction: A transaction element.
+    :return entry: The values of the transaction, see GROUPS.
+    """
+    code = date = valuedate = amount = country = sector = tiedcode = tiedamount = None
+    for element in transaction:
+        tag = element.tag
+        if tag == 'transaction-type':
+            code = element.get('code')
+        elif tag == 'transaction-date':
+            date = element.get('iso-date')
+        elif tag == 'value':
+            amount = element.text
+            valuedate = element.get('value-date')
+        elif tag == 'recipient-country':
+            country = element.get('code')
+        elif tag == 'sector':
+            sector = element.get('code')
+        elif tag == DAC + 'tied-status':
+            tiedcode = element.get('code')
+            value = element.find(DAC + 'value')
+            tiedamount = value.text if value is not None else None
+    return code, date, valuedate, amount, country, sector, tiedcode, tiedamount
+
+
+def _parse_crs_add(crsadd, fields, groups):
+    """
+    Read a crs-add element into the activity's fields and groups.
+    :param crsadd: The crs-add element.
+    :param fields: The activity's field list, filled in place.
+    :param groups: The activity's group lists, filled in place.
+    """
+    for element in crsadd:
+        tag = element.tag
+        if tag == DAC + 'loan-terms':
+            values = [element.get('rate-1'), element.get('rate-2')]
+            for name, attribute in [('repayment-type', 'code'), ('repayment-plan', 'code'),
+                                    ('repayment-first-date', 'iso-date'), ('repayment-final-date', 'iso-date')]:
+                child = element.find(DAC + name)
+                values.append(child.get(attribute) if child is not None else None)
+            for column, value in zip(LOAN_TERM_COLUMNS, values):
+                fields[COLUMN[column]] = value
+        elif tag == DAC + 'grant-equivalent':
+            groups['grant_equivalent'].append((element.get('value'),))
+        elif tag == 'loan-status':
+            amounts = {LOAN_STATUS_AMOUNTS.get(child.tag): child.text for child in element}
+            groups['loan_status'].append((element.get('value-date'), element.get('year')) +
+                                         tuple(amounts.get(column) for column in GROUPS['loan_status'][2:]))
+        elif tag == DAC + 'mobilisation':
+            values = {child.tag: child for child in element}
+            leverage = values.get(DAC + 'mobilisation-leverage')
+            origin = values.get(DAC + 'mobilisation-origin')
+            amount = values.get(DAC + 'value')
+            groups['mobilisation'].append((leverage.get('code') if leverage is not None else None,
+                                           origin.get('code') if origin is not None else None,
+                                           amount.text if amount is not None else None))
+        else:
+            spec, column = _match(OTHER_AMOUNT_LOOKUP, element)
+            if spec is not None:
+                value = element.find(DAC + 'value')
+                groups['other_amounts'].append((spec.column, value.text if value is not None else None,
+                                                value.get('value-date') if value is not None else None))
+                continue
+            spec, column = _match(CRS_ADD_LOOKUP, element)
+            if spec is not None:
+                fields[column] = _value(spec, element)
+
+
+def open_document(path):
+    """
+    Open a converted document for reading, whatever its compression.
+    :param path: The .xml, .xml.gz, .xml.zst or .zip output.
+    :return stream: A binary stream of the uncompressed document.
+    """
+    if path.endswith('.zip'):
+        import zipfile
+
+        archive = zipfile.ZipFile(path)
+        return archive.open(archive.namelist()[0])
+    if path.endswith('.gz'):
+        import gzip
+
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        zstd, stdlib = zstd_module()
+        if stdlib:
+            return zstd.open(path, 'rb')
+        return zstd.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+    return open(path, 'rb')
+
+
+def output_files(path):
+    """
+    Return the documents of an output.
+    :param path: A document, or the manifest of a sharded output, see shards.ShardWriter.
+    :return files: List of document paths.
+    """
+    if not path.endswith('-manifest.json'):
+        return [path]
+    with open(path, encoding='utf-8') as manifestfile:
+        manifest = json.load(manifestfile)
+    directory = os.path.dirname(path)
+    return [os.path.join(directory, shard['file']) for shard in manifest['shards']]
+
+
+def iter_activities(path):
+    """
+    Parse a converted document one iati-activity at a time. Each activity is dropped once it has
+    been read, so memory stays the size of one activity however large the document is.
+    :param path: The document, see open_document.
+    :return: Records, see parse_activity, in document order.
+    """
+    with open_document(path) as document:
+        root = None
+        for event, element in ElementTree.iterparse(document, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+            if element.tag == 'iati-activity':
+                yield parse_activity(element)
+                root.clear()
+
+
+def to_columns(records):
+    """
+    Lay records out as CRS-shaped columns.
+    :param records: Records, see parse_activity.
+    :return activities: Dictionary of column name to list, with crs_id_number and ACTIVITY_COLUMNS,
+                        one row per activity.
+    :return groups: Dictionary of group name to a dictionary of column name to list, with crs_id_number and the
+                    columns of the group, one row per entry.
+    """
+    activities = {name: [] for name in ['crs_id_number'] + ACTIVITY_COLUMNS}
+    groups = {group: {name: [] for name in ['crs_id_number'] + columns} for group, columns in GROUPS.items()}
+    for record in records:
+        activities['crs_id_number'].append(record.id)
+        for name, value in zip(ACTIVITY_COLUMNS, record.fields):
+            activities[name].append(value)
+        for (group, columns), entries in zip(GROUPS.items(), record.groups):
+            table = groups[group]
+            for entry in entries:
+                table['crs_id_number'].append(record.id)
+                for name, value in zip(columns, entry):
+                    table[name].append(value)
+    return activities, groups
@@ -0,0 +1,365 @@
+import csv
+import datetime
+import hashlib
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import pandas
+
+from .mapping import OTHER_AMOUNT_FIELDS
+from .normalize import CHAINS, COLUMNS, CONVERTERS, DATES, DEFAULT_DATE, SOURCE_COLUMNS
+from .reverse import (ACTIVITY_COLUMNS, CRS_ADD_GROUPS, ENTRY_COLUMNS, FIRST_ROW_COLUMNS, FIRST_VALUE_COLUMNS,
+                      FLAG_COLUMNS, GROUPS, LOAN_TERM_COLUMNS, RATE_COLUMNS, Record, iter_activities, output_files,
+                      to_columns)
+
+# Mismatched activities whose fields are compared one by one. Past this only the counts are kept.
+MAX_DETAILS = 10000
+
+ENTRY = re.compile(r'\[\d+\]')
+
+# Day 0 of Excel serial dates, see dates.EXCEL_EPOCH.
+EXCEL_DAY = datetime.date(1899, 12, 30)
+
+# The kind of every column, see mapping.Field: the source columns as normalize reads them, and the
+# columns normalize derives from its chains.
+KINDS = {name: 'amount' for chain in CHAINS.values() for name, code in chain}
+KINDS.update((name, kind) for kind, converter in CONVERTERS.items() for name in COLUMNS if COLUMNS[name] is converter)
+KINDS.update((name + '_amount', 'amount') for name in CHAINS)
+KINDS.update((name + '_code', 'code') for name in CHAINS)
+KINDS.update((name, 'date') for name in DATES)
+KINDS.update(recipient_code='text', column='text')
+
+
+def _number(value):
+    """
+    :param value: A cell.
+    :return number: The number it holds as a float, or None.
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if abs(number) < float('inf') else None
+
+
+def _day(value):
+    """
+    Read a cell as a day, the way a spreadsheet user would: a date, a year, an Excel serial or date text.
+    :param value: A cell.
+    :return day: The datetime.date, or None.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    number = _number(value)
+    if number is not None:
+        if number.is_integer() and 1900 <= number <= 2100:
+            return datetime.date(int(number), 1, 1)
+        if 1 <= number <= 2958465:
+            return EXCEL_DAY + datetime.timedelta(days=int(number))
+        return None
+    text = str(value).strip()
+    try:
+        stamp = pandas.Timestamp(text) if text else pandas.NaT
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return stamp.date() if stamp is not pandas.NaT else None
+
+
+@lru_cache(maxsize=1 << 16, typed=True)
+def canonical(kind, value):
+    """
+    Return a value in a form that compares equal however it was written: a source cell, or the text
+    the converter wrote for it. Canonical values are returned unchanged.
+    :param kind: The kind of the column, see mapping.Field.
+    :param value: The cell or the text.
+    :return value: An int for codes, a float for amounts and numbers, a datetime.date for dates and years,
+                   stripped text, or None for empty cells and values that are not of the kind.
+    """
+    if value is None or value is pandas.NaT or value is pandas.NA or isinstance(value, float) and value != value:
+        return None
+    if kind == 'text':
+        return str(value).strip() or None
+    if kind == 'date':
+        return _day(value)
+    number = _number(value)
+    if kind == 'year':
+        # A year, or a date written for a year as the first day of the year.
+        if number is None:
+            day = _day(value)
+            return day if day is not None and (day.month, day.day) == (1, 1) else None
+        return datetime.date(int(number), 1, 1) if number.is_integer() and 1 <= number <= 9999 else None
+    if number is None:
+        return None
+    if kind == 'code':
+        return int(number)
+    if kind == 'amount':
+        return round(number, 2)
+    return number
+
+
+def canonical_column(series, kind):
+    """
+    Apply canonical to a source column, once per distinct value.
+    :param series: The source column.
+    :param kind: The kind of the column.
+    :return column: A list of canonical values.
+    """
+    codes, distinct = pandas.factorize(series, sort=False)
+    values = [canonical(kind, value) for value in distinct]
+    return [values[code] if code >= 0 else None for code in codes.tolist()]
+
+
+def source_columns(crs):
+    """
+    Read the cells of a source chunk as canonical values, without the converter's normalization, to
+    check the output against. The chains of normalize.CHAINS and normalize.DATES are applied to them.
+    :param crs: The crs DataFrame.
+    :return columns: Dictionary of column name to list of canonical values, see canonical.
+    """
+    crs = crs.reset_index(drop=True)
+    columns = {}
+    for name in SOURCE_COLUMNS:
+        columns[name] = canonical_column(crs[name], KINDS[name]) if name in crs else [None] * len(crs)
+    # The first column of a chain with a value wins, so the chain is applied last to first.
+    for name, chain in CHAINS.items():
+        amounts = [None] * len(crs)
+        codes = [None] * len(crs)
+        for column, code in reversed(chain):
+            for row, amount in enumerate(columns[column]):
+                if amount is not None:
+                    amounts[row] = amount
+                    codes[row] = int(code)
+        columns[name + '_amount'], columns[name + '_code'] = amounts, codes
+    for name, chain in DATES.items():
+        dates = [canonical('date', DEFAULT_DATE)] * len(crs)
+        for column, kind in reversed(chain):
+            if column in crs:
+                for row, day in enumerate(canonical_column(crs[column], kind)):
+                    if day is not None:
+                        dates[row] = day
+        columns[name] = dates
+    return columns
+
+
+def _first(values, rows):
+    """
+    :return value: The first value in the rows that is not None, or None.
+    """
+    return next((values[row] for row in rows if values[row] is not None), None)
+
+
+def source_record(activityid, crscolumns, activityRows):
+    """
+    Lay the source rows of an activity out as a record, taking every field from the rows reverse
+    declares it is read from, see reverse.FIRST_ROW_COLUMNS and reverse.ENTRY_COLUMNS.
+    :param activityid: The activity identifier.
+    :param crscolumns: Source columns, see source_columns, with recipient_code.
+    :param activityRows: Positions of the activity's rows in crscolumns, in source order.
+    :return record: The reverse.Record, see canonical_record.
+    """
+    values = {name: crscolumns[name][activityRows[0]] for name in FIRST_ROW_COLUMNS}
+    groups = {name: [] for name in GROUPS}
+    crsadd = any(_first(crscolumns[name], activityRows) is not None for name in FLAG_COLUMNS)
+    if crsadd:
+        values.update((name, _first(crscolumns[name], activityRows)) for name in FIRST_VALUE_COLUMNS)
+        rate = next((row for row in activityRows if any(crscolumns[name][row] is not None for name in RATE_COLUMNS)),
+                    None)
+        if rate is not None:
+            values.update((name, crscolumns[name][rate]) for name in LOAN_TERM_COLUMNS)
+        groups['other_amounts'] = [(spec.column, crscolumns[spec.column][row], crscolumns['commitment_date'][row])
+                                   for row in activityRows for spec in OTHER_AMOUNT_FIELDS
+                                   if crscolumns[spec.column][row] is not None]
+    for group, entry in ENTRY_COLUMNS.items():
+        if group in CRS_ADD_GROUPS and not crsadd:
+            continue
+        groups[group] = [tuple(crscolumns[name][row] for name in GROUPS[group]) for row in activityRows
+                         if any(crscolumns[name][row] is not None for name in entry)]
+    return canonical_record(Record(activityid, tuple(values.get(name) for name in ACTIVITY_COLUMNS),
+                                   tuple(groups[name] for name in GROUPS)))
+
+
+def canonical_record(record):
+    """
+    :param record: A reverse.Record.
+    :return record: The same record with canonical values, see canonical.
+    """
+    fields = tuple(canonical(KINDS[name], value) for name, value in zip(ACTIVITY_COLUMNS, record.fields))
+    groups = []
+    for (group, columns), entries in zip(GROUPS.items(), record.groups):
+        if group == 'other_amounts':
+            # The value has the kind of the column it was written for.
+            groups.append([(column, canonical(KINDS.get(column, 'number'), value), canonical('date', day))
+                           for column, value, day in entries])
+        else:
+            groups.append([tuple(canonical(KINDS[name], value) for name, value in zip(columns, entry))
+                           for entry in entries])
+    return Record(record.id, fields, tuple(groups))
+
+
+def digest(record):
+    """
+    :param record: A reverse.Record with canonical values.
+    :return digest: 16 bytes that change with any value of the record.
+    """
+    # repr rather than pickle, whose output depends on which equal strings are the same object.
+    return hashlib.blake2b(repr((record.fields, record.groups)).encode('utf-8'), digest_size=16).digest()
+
+
+def digest_file(path):
+    """
+    Parse one document and digest every activity. Runs in a worker process.
+    :param path: The document.
+    :return digests: List of (activity id, digest), in document order.
+    """
+    return [(record.id, digest(canonical_record(record))) for record in iter_activities(path)]
+
+
+def collect_records(path, ids):
+    """
+    Parse one document and keep the activities asked for. Runs in a worker process.
+    :param path: The document.
+    :param ids: Set of activity ids.
+    :return records: List of reverse.Record with canonical values.
+    """
+    return [canonical_record(record) for record in iter_activities(path) if record.id in ids]
+
+
+def compare(expected, found):
+    """
+    Lay two records out as CRS-shaped tables, see reverse.to_columns, and compare them column by column.
+    :param expected: The reverse.Record of the source.
+    :param found: The reverse.Record read from the output.
+    :return mismatches: List of (field, expected value, found value). Group fields are named group[entry].column,
+                        and a group with a different number of entries is reported as group with the counts.
+    """
+    wantactivity, wantgroups = to_columns([expected])
+    gotactivity, gotgroups = to_columns([found])
+    mismatches = [(name, wantactivity[name][0], gotactivity[name][0]) for name in ACTIVITY_COLUMNS
+                  if wantactivity[name] != gotactivity[name]]
+    for group, columns in GROUPS.items():
+        wanted, gotten = wantgroups[group], gotgroups[group]
+        if len(wanted['crs_id_number']) != len(gotten['crs_id_number']):
+            mismatches.append((group, '{0} entries'.format(len(wanted['crs_id_number'])),
+                               '{0} entries'.format(len(gotten['crs_id_number']))))
+            continue
+        for name in columns:
+            mismatches.extend(('{0}[{1}].{2}'.format(group, k, name), want, got)
+                              for k, (want, got) in enumerate(zip(wanted[name], gotten[name])) if want != got)
+    return mismatches
+
+
+class RoundTrip:
+    """
+    Check a converted output against its source: every activity is read back from the output and
+    compared with the source cells it was built from. Both sides are compared as canonical values,
+    read without the converter's normalization, so a value it normalized wrongly shows as a mismatch.
+
+    The output is digested one activity at a time, one document per worker for sharded output, and
+    the source is streamed as in a conversion, so memory holds a digest per activity rather than the
+    activities. Only activities whose digests differ are read again to find the fields that differ.
+    """
+
+    def __init__(self, outputpath, workers=1):
+        """
+        :param outputpath: The output document, or the manifest of a sharded output.
+        :param workers: Documents parsed at a time.
+        """
+        self.files = output_files(outputpath)
+        self.workers = workers
+        self.digests = {}
+        self.repeated = []
+        self.checked = 0
+        self.matched = 0
+        self.missing = []
+        self.mismatched = []
+        self.details = {}
+        self.fields = Counter()
+
+    def _map(self, function, *arguments):
+        """
+        Run a function over every document, in a pool when there are several workers.
+        :return results: The results in document order.
+        """
+        if self.workers > 1 and len(self.files) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(self.files))) as pool:
+                return list(pool.map(function, self.files, *[[argument] * len(self.files) for argument in arguments]))
+        return [function(path, *arguments) for path in self.files]
+
+    def read_output(self):
+        """
+        Digest every activity of the output.
+        """
+        for digests in self._map(digest_file):
+            for activityid, activitydigest in digests:
+                if activityid in self.digests:
+                    self.repeated.append(activityid)
+                self.digests[activityid] = activitydigest
+
+    def check(self, activities):
+        """
+        Compare the source activities with the output.
+        :param activities: Tuples of activity id, columns and row positions, see grouping.stream_activities,
+                           with the columns of source_columns.
+        """
+        for activityid, crscolumns, activityRows in activities:
+            self.checked += 1
+            found = self.digests.pop(activityid, None)
+            if found is None:
+                self.missing.append(activityid)
+                continue
+            record = source_record(activityid, crscolumns, activityRows)
+            if found == digest(record):
+                self.matched += 1
+            else:
+                self.mismatched.append(activityid)
+                if len(self.details) < MAX_DETAILS:
+                    self.details[activityid] = record
+        if self.details:
+            for records in self._map(collect_records, set(self.details)):
+                for found in records:
+                    mismatches = compare(self.details[found.id], found)
+                    self.details[found.id] = mismatches
+                    # Counted by field, without the entry: transaction.transaction_amount.
+                    self.fields.update(ENTRY.sub('', name) for name, _, _ in mismatches)
+
+    def extra(self):
+        """
+        :return ids: Activities of the output that are not in the source.
+        """
+        return list(self.digests)
+
+    def write_report(self, path):
+        """
+        Write the differences as tab-separated lines: id, field, expected and found.
+        :param path: The report file.
+        """
+        with open(path, 'w', encoding='utf-8', newline='') as reportfile:
+            lines = csv.writer(reportfile, delimiter='\t', lineterminator='\n')
+            lines.writerow(['id', 'field', 'expected', 'found'])
+            for activityid in self.missing:
+                lines.writerow([activityid, 'activity', 'present', 'missing'])
+            for activityid in self.extra():
+                lines.writerow([activityid, 'activity', 'missing', 'present'])
+            for activityid in self.repeated:
+                lines.writerow([activityid, 'activity', 'once', 'repeated'])
+            for activityid in self.mismatched:
+                mismatches = self.details.get(activityid)
+                if not isinstance(mismatches, list):
+                    lines.writerow([activityid, 'activity', '', 'not compared'])
+                    continue
+                for name, want, got in mismatches:
+                    lines.writerow([activityid, name, '' if want is None else want, '' if got is None else got])
+
+    def summary(self):
+        """
+        :return summary: Dictionary of the counts, and of the mismatches by field.
+        """
+        return {'activities': self.checked, 'matched': self.matched, 'mismatched': len(self.mismatched),
+                'missing': len(self.missing), 'extra': len(self.digests), 'repeated': len(self.repeated),
+                'fields': dict(self.fields.most_common())}
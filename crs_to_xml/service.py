@@ -0,0 +1,320 @@
+import json
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from .convert import Converter
+
+# Files the service converts. Office lock files (~$name.xlsx) and hidden files are skipped.
+SOURCE_EXTENSIONS = ('.xlsx', '.xlsm', '.xls', '.csv', '.tsv', '.tab')
+
+# Conversions kept for the latency figures of the status.
+RECENT = 50
+
+# Times a file is tried again after a worker process stopped while converting it.
+RETRIES = 2
+
+# The Converter of a service worker process, kept between files.
+_converter = None
+
+
+def _start_worker(options):
+    """
+    Set up a service worker process.
+    :param options: The conversion Options.
+    """
+    global _converter
+    # Interrupting the service lets the conversions in flight finish.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _converter = Converter(options)
+
+
+def publish(staging, output):
+    """
+    Move everything written to a staging directory into the export directory.
+    Each file is replaced atomically, and manifests and sidecar files go last, so a reader never
+    sees a manifest or index pointing at files that are not there yet.
+    :param staging: The staging directory, on the same file system as output.
+    :param output: The export directory.
+    """
+    names = []
+    for directory, _, filenames in os.walk(staging):
+        names.extend(os.path.relpath(os.path.join(directory, filename), staging) for filename in filenames)
+    names.sort(key=lambda name: (name.endswith(('-manifest.json', '-index.tsv', '-validation.tsv')), name))
+    for name in names:
+        target = os.path.join(output, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(os.path.join(staging, name), target)
+
+
+def convert_file(filetoopen, output):
+    """
+    Convert one file in a service worker, writing to a staging directory that is published when done.
+    :param filetoopen: The crs source file.
+    :param output: The export directory.
+    :return summary: See Converter.convert, with the output in the export directory and the seconds taken.
+    """
+    started = time.time()
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=output)
+    try:
+        summary = _converter.convert(filetoopen, staging)
+        publish(staging, output)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    summary['output'] = os.path.join(output, os.path.relpath(summary['output'], staging))
+    summary['seconds'] = time.time() - started
+    return summary
+
+
+def write_json(path, data):
+    """
+    Replace a JSON file atomically.
+    :param path: The file.
+    :param data: The JSON data.
+    """
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as jsonfile:
+        json.dump(data, jsonfile, indent=2)
+    os.replace(temporary, path)
+
+
+class WatchService:
+    """
+    Watch a folder and convert every new or changed CRS file in it.
+
+    A file is queued once its size and modification time are the same on two polls in a row,
+    so files still being copied are left alone. At most queuesize files wait and workers convert at
+    a time; files that settle while the queue is full stay in the folder and are picked up later.
+    Each conversion is written to a staging directory and published when it is done, and the
+    state file records what was converted, so a restarted service converts again exactly the
+    files that were queued or in flight.
+    """
+
+    def __init__(self, watchdir, output='export', options=None, workers=2, queuesize=16, poll=2.0,
+                 statedir=None, statusfile=None, log=print):
+        """
+        :param watchdir: The folder to watch.
+        :param output: The export directory.
+        :param options: The conversion Options, or a dictionary of them.
+        :param workers: Files converted at a time, each in a process that keeps its Converter.
+        :param queuesize: Files that may wait for a worker.
+        :param poll: Seconds between scans of the folder.
+        :param statedir: Directory for the state file, <output>/.service by default.
+        :param statusfile: Optional file the status is written to after every poll, see status.
+        :param log: Function called with a line for every file converted.
+        """
+        self.watchdir = watchdir
+        self.output = output
+        self.options = options
+        self.workers = workers
+        self.queuesize = queuesize
+        self.poll = poll
+        self.statedir = statedir if statedir is not None else os.path.join(output, '.service')
+        self.statusfile = statusfile
+        self.log = log
+        os.makedirs(self.output, exist_ok=True)
+        os.makedirs(self.statedir, exist_ok=True)
+        self.statepath = os.path.join(self.statedir, 'state.json')
+        # Source file name: [size, modification time] of the version converted, or of the one that failed.
+        self.done = {}
+        self.failed = {}
+        if os.path.exists(self.statepath):
+            with open(self.statepath, encoding='utf-8') as statefile:
+                state = json.load(statefile)
+            self.done = state['done']
+            self.failed = state['failed']
+        # Staging directories of conversions that were running when the service stopped.
+        for name in os.listdir(self.output):
+            if name.startswith('.staging-'):
+                shutil.rmtree(os.path.join(self.output, name), ignore_errors=True)
+        self.seen = {}
+        self.queue = deque()
+        self.running = {}
+        self.deferred = 0
+        self.completed = 0
+        self.activities = 0
+        self.recent = deque(maxlen=RECENT)
+        self.started = time.time()
+        self.pool = None
+        self.stopping = threading.Event()
+        self.snapshot = self.status()
+
+    def scan(self):
+        """
+        Queue the files that settled since the last poll and differ from the version last converted.
+        """
+        busy = {job[0] for job in self.running.values()} | {job[0] for job in self.queue}
+        seen = {}
+        self.deferred = 0
+        for entry in sorted(os.scandir(self.watchdir), key=lambda entry: entry.name):
+            name = entry.name
+            if name.startswith(('.', '~$')) or not name.lower().endswith(SOURCE_EXTENSIONS) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            version = [stat.st_size, stat.st_mtime_ns]
+            seen[name] = version
+            if name in busy or self.seen.get(name) != version:
+                continue
+            if self.done.get(name) == version or self.failed.get(name) == version:
+                continue
+            if len(self.queue) >= self.queuesize:
+                self.deferred += 1
+                continue
+            self.queue.append((name, version, time.time(), 0))
+        self.seen = seen
+
+    def dispatch(self):
+        """
+        Hand queued files to the workers, one per free worker.
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_start_worker,
+                                            initargs=(self.options,))
+        while self.queue and len(self.running) < self.workers:
+            name, version, queued, attempt = self.queue.popleft()
+            future = self.pool.submit(convert_file, os.path.join(self.watchdir, name), self.output)
+            self.running[future] = (name, version, queued, attempt, time.time())
+
+    def collect(self, finished):
+        """
+        Record finished conversions.
+        :param finished: The futures that are done.
+        """
+        broken = False
+        for future in finished:
+            name, version, queued, attempt, dispatched = self.running.pop(future)
+            try:
+                summary = future.result()
+            except BrokenProcessPool:
+                # A worker stopped, maybe out of memory, and took every conversion in flight with it.
+                # They are tried again, and given up on until they change if it keeps happening.
+                broken = True
+                if attempt < RETRIES:
+                    self.queue.appendleft((name, version, queued, attempt + 1))
+                else:
+                    self.failed[name] = version
+                    self.log('Failed {0}: a worker process stopped'.format(name))
+                continue
+            except Exception as error:
+                self.failed[name] = version
+                self.log('Failed {0}: {1}'.format(name, error))
+                continue
+            self.done[name] = version
+            self.failed.pop(name, None)
+            self.completed += 1
+            self.activities += summary['activities']
+            self.recent.append({'file': name, 'output': summary['output'], 'activities': summary['activities'],
+                                'waited': dispatched - queued, 'seconds': summary['seconds'],
+                                'latency': time.time() - queued})
+            self.log('Converted {0}: {1} activities in {2:.1f}s, wrote {3}'.format(
+                name, summary['activities'], summary['seconds'], summary['output']))
+        if broken:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        self.save()
+
+    def save(self):
+        """
+        Write the state file.
+        """
+        write_json(self.statepath, {'done': self.done, 'failed': self.failed})
+
+    def status(self):
+        """
+        :return status: Dictionary of the queue, the files in flight, throughput and the latency of recent files.
+        """
+        elapsed = max(time.time() - self.started, 1e-9)
+        latencies = sorted(job['latency'] for job in self.recent)
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'queued': [job[0] for job in self.queue],
+            'queue depth': len(self.queue),
+            'deferred': self.deferred,
+            'in flight': sorted(job[0] for job in self.running.values()),
+            'completed': self.completed,
+            'failed': sorted(self.failed),
+            'files per minute': self.completed * 60.0 / elapsed,
+            'activities per second': self.activities / elapsed,
+            'latency': {
+                'median': latencies[len(latencies) // 2] if latencies else None,
+                'max': latencies[-1] if latencies else None,
+            },
+            'recent': list(self.recent),
+        }
+
+    def serve_status(self, port):
+        """
+        Serve the status as JSON on http://127.0.0.1:<port>/ from a background thread.
+        :param port: The port.
+        :return server: The HTTP server.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        service = self
+
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(service.snapshot, indent=2).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), StatusHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def run(self, once=False):
+        """
+        Watch and convert until stop is called or the process is interrupted.
+        Conversions in flight are finished before returning.
+        :param once: Return as soon as nothing is queued or in flight, after at least two polls.
+        """
+        polls = 0
+        try:
+            while not self.stopping.is_set():
+                self.scan()
+                polls += 1
+                self.dispatch()
+                self.report()
+                if once and polls > 1 and not self.queue and not self.running:
+                    break
+                if self.running:
+                    finished, _ = wait(list(self.running), timeout=self.poll, return_when=FIRST_COMPLETED)
+                    if finished:
+                        self.collect(finished)
+                else:
+                    self.stopping.wait(self.poll)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.running:
+                self.collect(wait(list(self.running))[0])
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+            self.report()
+
+    def report(self):
+        """
+        Update the status for the endpoint and the status file.
+        """
+        self.snapshot = self.status()
+        if self.statusfile is not None:
+            write_json(self.statusfile, self.snapshot)
+
+    def stop(self):
+        """
+        Ask run to return after the conversions in flight.
+        """
+        self.stopping.set()
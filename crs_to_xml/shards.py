@@ -0,0 +1,231 @@
+import json
+import os
+import queue
+import re
+import threading
+from contextlib import ExitStack
+
+from .index import INDEX_FIELDS
+from .writer import COMPRESSIONS, ActivityWriter, open_output
+
+# Fields an output can be split by, see index.INDEX_FIELDS.
+SHARD_KEYS = list(INDEX_FIELDS)
+
+# Fragments queued per writer thread before the converter waits.
+QUEUE_SIZE = 256
+
+
+def shard_name(key):
+    """
+    Return the file name part for a shard key.
+    :param key: The key value, None or '' when the activity has none.
+    :return name: Letters, digits, '.', '-' and '_' only.
+    """
+    if key is None or key == '':
+        return 'none'
+    return re.sub(r'[^\w.-]', '_', str(key))
+
+
+class Shard:
+    """
+    One output document. Opened, written and closed by a single writer thread.
+    """
+
+    def __init__(self, path, key, thread):
+        """
+        :param path: The output path before the compression suffix.
+        :param key: The shard key, or None.
+        :param thread: Index of the writer thread that owns the shard.
+        """
+        self.path = path
+        self.key = key
+        self.thread = thread
+        self.activities = 0
+        self.bytes = 0
+        self.stack = None
+        self.writer = None
+        self.finished = False
+
+
+class ShardWriter:
+    """
+    Split the output into standalone iati-activities documents, each with the same root attributes.
+    A shard is closed once it reaches max_activities or max_bytes, and with a key every key value gets
+    its own shards. Shards are written by a small pool of threads, so compressing one shard overlaps
+    with the others and with the conversion.
+    """
+
+    def __init__(self, outputdir, name, attrib, compression='none', key=None, max_activities=None,
+                 max_bytes=None, threads=4, index=None, blocksize=None):
+        """
+        :param outputdir: Directory for the shards and the manifest.
+        :param name: File name prefix, such as new_crs1.
+        :param attrib: Dictionary of root attributes, written to every shard.
+        :param compression: See writer.COMPRESSIONS.
+        :param key: One of SHARD_KEYS, or None.
+        :param max_activities: Activities per shard, or None for no limit.
+        :param max_bytes: Uncompressed bytes of activities per shard, or None for no limit.
+        :param threads: Number of writer threads.
+        :param index: An index.IndexWriter to add every activity to, or None.
+        :param blocksize: Compressed block size for the index, see writer.open_output.
+        """
+        self.outputdir = outputdir
+        self.name = name
+        self.attrib = attrib
+        self.compression = compression
+        self.key = key
+        self.max_activities = max_activities
+        self.max_bytes = max_bytes
+        self.index = index
+        self.blocksize = blocksize
+        self.shards = []
+        self.current = {}
+        self.error = None
+        self.queues = [queue.Queue(QUEUE_SIZE) for _ in range(max(1, threads))]
+        self.threads = [threading.Thread(target=self._run, args=(tasks,), daemon=True) for tasks in self.queues]
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self, tasks):
+        """
+        Writer thread: open, write and close the shards it owns, in the order they were queued.
+        """
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            shard, fragment, record = task
+            if self.error is not None:
+                continue
+            try:
+                if shard.stack is None:
+                    shard.stack = ExitStack()
+                    output_file = shard.stack.enter_context(open_output(shard.path, self.compression,
+                                                                        blocksize=self.blocksize))
+                    shard.writer = ActivityWriter(output_file, 'iati-activities', self.attrib)
+                if fragment is None:
+                    shard.writer.close()
+                    shard.stack.close()
+                    shard.finished = True
+                else:
+                    location = shard.writer.write_fragment(fragment)
+                    if self.index is not None:
+                        self.index.add(record[0], os.path.basename(shard.path) + COMPRESSIONS[self.compression],
+                                       location, record[1])
+            except BaseException as error:
+                self.error = error
+
+    def _open(self, key):
+        """
+        Start the next shard for a key.
+        :param key: The shard key, or None.
+        :return shard: The Shard.
+        """
+        parts = [self.name]
+        if self.key is not None:
+            parts.append(shard_name(key))
+        if self.max_activities is not None or self.max_bytes is not None:
+            parts.append('{0:05d}'.format(1 + sum(1 for shard in self.shards if shard.key == key)))
+        path = os.path.join(self.outputdir, '-'.join(parts) + '.xml')
+        shard = Shard(path, key, len(self.shards) % len(self.queues))
+        self.shards.append(shard)
+        self.current[key] = shard
+        return shard
+
+    def _close(self, shard):
+        """
+        Queue the end of a shard.
+        :param shard: The Shard.
+        """
+        self.queues[shard.thread].put((shard, None, None))
+
+    def write(self, fragment, record=None):
+        """
+        Write an activity to its shard.
+        :param fragment: A serialized activity, see writer.serialize_activity.
+        :param record: The activity id and fields, see index.record_activities. Needed with a key or an index.
+        """
+        if self.error is not None:
+            raise self.error
+        key = record[1][self.key] if self.key is not None else None
+        size = len(fragment.encode('utf-8'))
+        shard = self.current.get(key)
+        if shard is not None and shard.activities and \
+                (self.max_activities is not None and shard.activities >= self.max_activities or
+                 self.max_bytes is not None and shard.bytes + size > self.max_bytes):
+            self._close(shard)
+            shard = None
+        if shard is None:
+            shard = self._open(key)
+        shard.activities += 1
+        shard.bytes += size
+        self.queues[shard.thread].put((shard, fragment, record))
+
+    def close(self):
+        """
+        Finish every shard and write the manifest.
+        :return manifest: Path to the manifest.
+        """
+        for shard in self.current.values():
+            self._close(shard)
+        self.current = {}
+        self._stop()
+        if self.error is not None:
+            self._release()
+            raise self.error
+        manifest = os.path.join(self.outputdir, self.name + '-manifest.json')
+        with open(manifest, 'w', encoding='utf-8') as manifestfile:
+            json.dump({
+                'compression': self.compression,
+                'key': self.key,
+                'max_activities': self.max_activities,
+                'max_bytes': self.max_bytes,
+                'root': self.attrib,
+                'index': os.path.basename(self.index.path) if self.index is not None else None,
+                'shards': [{
+                    'file': os.path.basename(shard.path) + COMPRESSIONS[self.compression],
+                    'key': shard.key,
+                    'activities': shard.activities,
+                    'bytes': shard.bytes,
+                    'size': os.path.getsize(shard.path + COMPRESSIONS[self.compression]),
+                } for shard in self.shards],
+            }, manifestfile, indent=2)
+        return manifest
+
+    def abort(self):
+        """
+        Stop the writer threads after a failure. Shards already written are left as they are.
+        """
+        if self.error is None:
+            self.error = RuntimeError('Sharded output aborted')
+        self._stop()
+        self._release()
+
+    def _stop(self):
+        """
+        Let the writer threads finish their queues and wait for them.
+        """
+        for tasks in self.queues:
+            tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _release(self):
+        """
+        Close the files of shards that were not finished.
+        """
+        for shard in self.shards:
+            if shard.stack is not None and not shard.finished:
+                try:
+                    shard.stack.close()
+                except Exception:
+                    pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,126 @@
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+
+import numpy
+
+
+def row_size(columns):
+    """
+    Estimate the memory one row of normalized columns takes.
+    :param columns: Normalized columns, see normalize.normalize.
+    :return size: Bytes per row, at least 1.
+    """
+    rows = len(next(iter(columns.values())))
+    if not rows:
+        return 1
+    # A list slot per cell, and the value itself for cells that are set.
+    size = sum(8 * len(values) + sum(sys.getsizeof(value) for value in values if value is not None)
+               for values in columns.values())
+    return max(1, size // rows)
+
+
+def plan_partitions(grouping, rowsper):
+    """
+    Split the activities into partitions of consecutive activities, in first-appearance order,
+    of at most rowsper rows each. An activity with more rows is a partition of its own.
+    :param grouping: The result of grouping.group_split.
+    :param rowsper: Rows a partition may hold.
+    :return bounds: Index of the first activity of each partition and, last, the number of activities.
+    """
+    offsets = grouping.offsets
+    bounds = [0]
+    while bounds[-1] < len(grouping.ids):
+        start = bounds[-1]
+        # The last activity whose rows still fit after the partition's first activity.
+        end = int(numpy.searchsorted(offsets, offsets[start] + rowsper, side='right')) - 1
+        bounds.append(max(end, start + 1))
+    return bounds
+
+
+def spill_activities(grouping, chunks, budget, spilldir=None, log=None):
+    """
+    Yield each activity with its rows, like grouping.stream_activities, holding at most about
+    budget bytes of rows in memory however the rows of an activity are spread over the file.
+
+    Activities are split into partitions of consecutive activities that fit the budget. While
+    the file is read, the rows of every chunk are appended to a run file per partition, then
+    each partition is loaded on its own and its activities are yielded. The partitions follow
+    first-appearance order, so the activities come out in the same order as without spilling.
+    :param grouping: The result of grouping.group_split over the whole file.
+    :param chunks: Normalized columns for consecutive slices of the file, see normalize.normalize.
+    :param budget: Bytes of rows to hold in memory at a time.
+    :param spilldir: Directory for the run files, the system temporary directory by default.
+    :param log: Optional function called with the number of partitions.
+    :return: Tuples of the activity id, the columns holding its rows and the row positions in them.
+    """
+    chunks = iter(chunks)
+    columns = next(chunks, None)
+    if columns is None:
+        if len(grouping.ids):
+            raise ValueError('The source file has fewer rows than were grouped.')
+        return
+    bounds = plan_partitions(grouping, max(1, budget // row_size(columns)))
+    if log is not None:
+        log('Spilling rows to {0} partitions'.format(len(bounds) - 1))
+
+    # The partition of every row, from the activity the row belongs to.
+    rowpartitions = numpy.empty(len(grouping.rows), dtype='int64')
+    counts = numpy.diff(grouping.offsets)
+    activitypartitions = numpy.repeat(numpy.arange(len(bounds) - 1), numpy.diff(bounds))
+    rowpartitions[grouping.rows] = numpy.repeat(activitypartitions, counts)
+
+    rundir = tempfile.mkdtemp(prefix='crs-spill-', dir=spilldir)
+    try:
+        runs = [os.path.join(rundir, '{0:06d}.pickle'.format(number)) for number in range(len(bounds) - 1)]
+        seen = 0
+        while columns is not None:
+            size = len(next(iter(columns.values())))
+            partitions = rowpartitions[seen:seen + size]
+            order = numpy.argsort(partitions, kind='stable')
+            numbers, starts = numpy.unique(partitions[order], return_index=True)
+            ends = list(starts[1:]) + [size]
+            for number, start, end in zip(numbers.tolist(), starts.tolist(), ends):
+                positions = order[start:end].tolist()
+                with open(runs[number], 'ab') as runfile:
+                    pickle.dump((seen + numpy.asarray(positions, dtype='int64'),
+                                 {name: [values[position] for position in positions]
+                                  for name, values in columns.items()}),
+                                runfile, protocol=pickle.HIGHEST_PROTOCOL)
+            seen += size
+            columns = next(chunks, None)
+        if seen < len(grouping.rows):
+            raise ValueError('The source file has fewer rows than were grouped.')
+
+        ids = grouping.ids.tolist()
+        offsets = grouping.offsets
+        for number, run in enumerate(runs):
+            globalrows, partition = _load_run(run)
+            os.remove(run)
+            for k in range(bounds[number], bounds[number + 1]):
+                activityRows = grouping.rows[offsets[k]:offsets[k + 1]]
+                yield ids[k], partition, numpy.searchsorted(globalrows, activityRows).tolist()
+            del globalrows, partition
+    finally:
+        shutil.rmtree(rundir, ignore_errors=True)
+
+
+def _load_run(run):
+    """
+    Read back the rows appended to a run file.
+    :param run: The run file.
+    :return globalrows: Position of every row in the file, in ascending order.
+    :return columns: The normalized columns of the rows, in the same order.
+    """
+    pieces = []
+    with open(run, 'rb') as runfile:
+        while True:
+            try:
+                pieces.append(pickle.load(runfile))
+            except EOFError:
+                break
+    globalrows = numpy.concatenate([positions for positions, _ in pieces])
+    columns = {name: [value for _, piece in pieces for value in piece[name]] for name in pieces[0][1]}
+    return globalrows, columns
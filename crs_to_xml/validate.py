@@ -0,0 +1,265 @@
+import bisect
+import csv
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .writer import start_tag
+
+# The bundled schemas: IATI 2.03 and the dac: extension elements. Nothing is fetched from the network.
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schemas', 'dac.xsd')
+
+# The schema declaring iati-activity, for the order of its children.
+ACTIVITY_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schemas', 'iati-2.03',
+                               'iati-activities-schema.xsd')
+
+# Activities per task sent to a validation worker.
+BATCH_ACTIVITIES = 200
+
+# Required iati-activity children the converter does not write, as the CRS has no source for them.
+# An activity without them fails at its first child and the schema then checks nothing after it. So an
+# activity that is invalid as written is checked again with these placeholders added and its children in
+# schema order, and every placeholder and move is reported as an error of its own, see complete_activity.
+HEADER = {
+    'iati-identifier': '<iati-identifier>placeholder</iati-identifier>',
+    'reporting-org': '<reporting-org ref="placeholder" type="10"><narrative>placeholder</narrative></reporting-org>',
+    'participating-org': '<participating-org role="1"/>',
+    'activity-status': '<activity-status code="2"/>',
+}
+HEADER_MESSAGE = ('Not written by the converter: {0}; other-identifier is written before title. '
+                  'Activities are also checked with placeholders for these.').format(', '.join(HEADER))
+
+# The schema of this process and the position of every iati-activity child, loaded on first use.
+_schema = None
+_order = None
+
+
+def load_schema(path=SCHEMA):
+    """
+    Return the compiled schema, loading it once per process. Needs lxml.
+    :param path: The schema file.
+    :return schema: The lxml XMLSchema.
+    """
+    global _schema
+    if _schema is None:
+        try:
+            from lxml import etree
+        except ImportError:
+            raise ImportError('Validation needs the lxml package') from None
+        _schema = etree.XMLSchema(etree.parse(path))
+    return _schema
+
+
+def activity_order(path=ACTIVITY_SCHEMA):
+    """
+    Return the position of every child of iati-activity in its schema sequence, loading it once per process.
+    :param path: The schema declaring iati-activity.
+    :return order: Dictionary of element name to position.
+    """
+    global _order
+    if _order is None:
+        from lxml import etree
+
+        xs = '{http://www.w3.org/2001/XMLSchema}'
+        declaration = next(element for element in etree.parse(path).iter(xs + 'element')
+                           if element.get('name') == 'iati-activity')
+        sequence = declaration.find('.//' + xs + 'sequence')
+        # Children are declared in place or by reference.
+        _order = {element.get('name') or element.get('ref'): k for k, element in enumerate(sequence)
+                  if element.get('name') or element.get('ref')}
+    return _order
+
+
+def complete_activity(activity):
+    """
+    Add the HEADER placeholders an activity lacks and put its children in schema order, so the
+    schema checks every child. Moved elements keep their source lines.
+    :param activity: The parsed iati-activity element, changed in place.
+    :return changes: List of (line in the activity, element path, message), one per placeholder and moved element.
+    """
+    from lxml import etree
+
+    order = activity_order()
+    tree = activity.getroottree()
+    changes = []
+    # Elements outside the sequence, such as other namespaces, go last as the schema allows.
+    last = None
+    for child in activity:
+        if not isinstance(child.tag, str):
+            continue
+        if last is not None and order.get(child.tag, len(order)) < order.get(last.tag, len(order)):
+            changes.append((child.sourceline - 1, tree.getpath(child).replace('/iati-activities', '', 1),
+                            "Element '{0}' is written after '{1}'; checked in schema order.".format(
+                                child.tag, last.tag)))
+        else:
+            last = child
+    present = {child.tag for child in activity}
+    for name, placeholder in HEADER.items():
+        if name not in present:
+            activity.append(etree.fromstring(placeholder))
+            changes.append((activity.sourceline - 1, '/iati-activity',
+                            "Missing element '{0}'; checked with a placeholder.".format(name)))
+    activity[:] = sorted(activity, key=lambda child: order.get(child.tag, len(order)))
+    return changes
+
+
+def schema_errors(schema):
+    """
+    :param schema: The schema a document of one activity was just validated with.
+    :return errors: List of (line in the activity, element path, message).
+    """
+    # The opening tag is line 1 of the document.
+    return [(error.line - 1, error.path.replace('/iati-activities', '', 1), error.message)
+            for error in schema.error_log]
+
+
+def validate_batch(root, start, fragments):
+    """
+    Validate serialized activities, each as a document of its own. Runs in a worker process.
+    An activity is checked as written and, if it is invalid, once more after complete_activity, so that
+    the children after its first error are checked too. The changes made for that are errors as well.
+    :param root: Dictionary of root attributes, for the namespaces.
+    :param start: Position of the first activity in the output.
+    :param fragments: Serialized activities, see writer.serialize_activity.
+    :return errors: List of (position of the activity, line in the activity, element path, message).
+    """
+    from lxml import etree
+
+    schema = load_schema()
+    opening = start_tag('iati-activities', root)
+    errors = []
+    for k, fragment in enumerate(fragments, start):
+        document = etree.fromstring((opening + '\n' + fragment + '</iati-activities>').encode('utf-8'))
+        if schema.validate(document):
+            continue
+        found = schema_errors(schema)
+        found.extend(complete_activity(document[0]))
+        if not schema.validate(document):
+            found.extend(error for error in schema_errors(schema) if error not in found)
+        errors.extend((k,) + error for error in found)
+    return errors
+
+
+class Validator:
+    """
+    Validate activities against the bundled schema while they are written. Activities are checked
+    in batches, in a pool of processes if asked for, and the output is never read back.
+    Errors are written as they are found, with the activity's rows in the source file.
+    """
+
+    def __init__(self, root, grouping, errorpath, workers=1, sources=None, keptrows=None):
+        """
+        :param root: Dictionary of root attributes of the output.
+        :param grouping: The grouping of the source file, see grouping.group_split. Activities must be
+                         written in its order.
+        :param errorpath: The tab-separated error file.
+        :param workers: Number of validation processes; 1 validates in this process.
+        :param sources: The names of the files read as one, the position of the first row of each and, for
+                        each, the row numbers of the blank rows the readers skipped, see convert.open_files.
+                        Rows are given as the file's spreadsheet rows, as file:row for several files.
+        :param keptrows: For activities merged from several files, their position in the grouping and the
+                         rows the merge policy kept, see merge.Merger. Other activities report all their rows.
+        """
+        load_schema()
+        activity_order()
+        self.root = root
+        self.grouping = grouping
+        self.errorpath = errorpath
+        self.workers = workers
+        self.sources = sources
+        self.keptrows = keptrows if keptrows is not None else {}
+        # For each file, the data row positions the skipped blank rows come after, see _source_row.
+        self.blanks = [[number - k - 2 for k, number in enumerate(sorted(skipped))] for skipped in sources[2]] \
+            if sources is not None else None
+        self.pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.pending = deque()
+        self.batch = []
+        self.activities = 0
+        self.invalid = set()
+        self.messages = Counter()
+        self.errorfile = open(errorpath, 'w', encoding='utf-8', newline='')
+        self.lines = csv.writer(self.errorfile, delimiter='\t', lineterminator='\n')
+        self.lines.writerow(['id', 'rows', 'line', 'path', 'message'])
+        self.lines.writerow(['', '', '', '/iati-activity', HEADER_MESSAGE])
+
+    def watch(self, fragments):
+        """
+        Validate fragments as they pass.
+        :param fragments: Serialized activities, see writer.serialize_activity.
+        :return: The same fragments.
+        """
+        for fragment in fragments:
+            self.batch.append(fragment)
+            if len(self.batch) >= BATCH_ACTIVITIES:
+                self._submit()
+            yield fragment
+        self._submit()
+
+    def _submit(self):
+        """
+        Validate the current batch, or hand it to the pool. At most two batches per worker are in flight.
+        """
+        if not self.batch:
+            return
+        if self.pool is None:
+            self._report(validate_batch(self.root, self.activities, self.batch))
+        else:
+            self.pending.append(self.pool.submit(validate_batch, self.root, self.activities, self.batch))
+            while len(self.pending) >= self.workers * 2:
+                self._report(self.pending.popleft().result())
+        self.activities += len(self.batch)
+        self.batch = []
+
+    def _report(self, errors):
+        """
+        Write the errors of a batch.
+        :param errors: See validate_batch.
+        """
+        grouping = self.grouping
+        for k, line, path, message in errors:
+            rows = self.keptrows.get(k)
+            if rows is None:
+                rows = grouping.rows[grouping.offsets[k]:grouping.offsets[k + 1]].tolist()
+            if self.sources is None:
+                rows = [str(row + 2) for row in rows]
+            else:
+                files, fileoffsets = self.sources[:2]
+                rowfiles = [bisect.bisect_right(fileoffsets, row) - 1 for row in rows]
+                rows = [self._source_row(rowfile, row - fileoffsets[rowfile]) for row, rowfile in zip(rows, rowfiles)]
+                if len(files) > 1:
+                    rows = ['{0}:{1}'.format(files[rowfile], row) for row, rowfile in zip(rows, rowfiles)]
+                else:
+                    rows = [str(row) for row in rows]
+            self.lines.writerow([grouping.ids[k], ' '.join(rows), line, path, message])
+            self.invalid.add(k)
+            self.messages[message] += 1
+
+    def _source_row(self, number, row):
+        """
+        Return the spreadsheet row of a data row, the header being row 1, counting the blank rows the readers skipped.
+        :param number: The file, by position in sources.
+        :param row: The position of the row among the file's data rows.
+        :return row: The spreadsheet row.
+        """
+        return row + 2 + bisect.bisect_right(self.blanks[number], row)
+
+    def close(self):
+        """
+        Wait for the batches in flight and close the error file.
+        :return invalid: The number of activities with errors.
+        """
+        self._submit()
+        while self.pending:
+            self._report(self.pending.popleft().result())
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.errorfile.close()
+        return len(self.invalid)
+
+    def abort(self):
+        """
+        Stop after a failed run.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        self.errorfile.close()
@@ -0,0 +1,243 @@
+import io
+import os
+from contextlib import contextmanager
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+INDENT = '  '
+
+# Output compressions and the suffix each adds to the file name. zip keeps the name for the archive entry.
+COMPRESSIONS = {
+    'zip': '.zip',
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'none': '',
+}
+
+# Uncompressed bytes per independently compressed block of an indexed output, see BlockFile.
+BLOCKSIZE = 1 << 20
+
+
+def start_tag(tag, attrib):
+    """
+    Return the opening tag for an element whose children are streamed.
+    :param tag: The element name.
+    :param attrib: Dictionary of attribute names and values.
+    :return tag: The serialized opening tag.
+    """
+    attributes = ''.join(' {0}="{1}"'.format(name, escape(value, {'"': '&quot;', '\n': '&#10;'}))
+                         for name, value in attrib.items())
+    return '<{0}{1}>'.format(tag, attributes)
+
+
+def serialize_activity(activity):
+    """
+    Return the indented XML for a single activity, as it appears inside the root element.
+    :param activity: The iati-activity element.
+    :return fragment: The serialized activity, one level deep and ending with a newline.
+    """
+    ElementTree.indent(activity, space=INDENT, level=1)
+    return INDENT + ElementTree.tostring(activity, encoding='unicode') + '\n'
+
+
+def zstd_module():
+    """
+    Return the zstd module: compression.zstd on Python 3.14 and later, otherwise the zstandard package.
+    :return module, stdlib: The module, and True for compression.zstd.
+    """
+    try:
+        from compression import zstd
+        return zstd, True
+    except ImportError:
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd output needs Python 3.14 or the zstandard package') from None
+        return zstandard, False
+
+
+def _zstd_open(path, level):
+    """
+    Open a zstd compressed binary file for writing.
+    :param path: The output file.
+    :param level: Compression level, or None for the default.
+    :return stream: The binary stream; closing it finishes the frame and closes the file.
+    """
+    zstd, stdlib = zstd_module()
+    if stdlib:
+        return zstd.open(path, 'wb', level=level)
+    return zstd.ZstdCompressor(level=3 if level is None else level).stream_writer(open(path, 'wb'))
+
+
+def block_compressor(compression, level=None):
+    """
+    Return the function compressing one block into a gzip member or zstd frame.
+    Concatenated members or frames are still a single valid file.
+    :param compression: 'gzip' or 'zstd'.
+    :param level: Compression level, or None for the default.
+    :return compress: Function of bytes to compressed bytes.
+    """
+    if compression == 'gzip':
+        import gzip
+        from functools import partial
+
+        return partial(gzip.compress, compresslevel=9 if level is None else level, mtime=0)
+    zstd, stdlib = zstd_module()
+    if stdlib:
+        return lambda data: zstd.compress(data, level)
+    return zstd.ZstdCompressor(level=3 if level is None else level).compress
+
+
+class BlockFile:
+    """
+    A text output that reports where every write lands, so it can be read back on its own.
+    With a compress function the output is cut into independently compressed blocks, and a block
+    only ends between writes, so each write can be recovered by decompressing a single block.
+    """
+
+    def __init__(self, stream, compress=None, blocksize=BLOCKSIZE):
+        """
+        :param stream: The binary stream to write to.
+        :param compress: Function compressing a block, see block_compressor, or None to write bytes as they are.
+        :param blocksize: Uncompressed bytes per block.
+        """
+        self.stream = stream
+        self.compress = compress
+        self.blocksize = blocksize
+        self.block = 0
+        self.buffer = []
+        self.size = 0
+
+    def write(self, text):
+        """
+        :param text: The text to write.
+        :return location: Offset of the block in the file, offset of the text in the uncompressed block,
+                          and its length in bytes. Without compression the whole file is one block.
+        """
+        data = text.encode('utf-8')
+        if self.compress is None:
+            self.stream.write(data)
+            self.size += len(data)
+            return self.block, self.size - len(data), len(data)
+        if self.size and self.size + len(data) > self.blocksize:
+            self.end_block()
+        self.buffer.append(data)
+        self.size += len(data)
+        return self.block, self.size - len(data), len(data)
+
+    def end_block(self):
+        """
+        Compress and write the current block.
+        """
+        if self.compress is not None and self.buffer:
+            block = self.compress(b''.join(self.buffer))
+            self.stream.write(block)
+            self.block += len(block)
+            self.buffer = []
+            self.size = 0
+
+    def close(self):
+        """
+        Write the last block and close the stream.
+        """
+        self.end_block()
+        self.stream.close()
+
+
+@contextmanager
+def open_output(path, compression='none', entry=None, level=None, blocksize=None):
+    """
+    Open the output for writing, compressing it as it is written so no uncompressed copy reaches the disk.
+    :param path: The output file, COMPRESSIONS[compression] is added to it.
+    :param compression: One of COMPRESSIONS.
+    :param entry: The file name inside a zip archive, by default the base name of path.
+    :param level: Compression level, or None for the default of each format.
+    :param blocksize: Write a BlockFile instead, so every activity can be located. gzip and zstd are then
+                      compressed in blocks of this many bytes; a zip entry is one deflate stream either way.
+    :return output_file: A text file or BlockFile; everything is flushed and closed when the block ends.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError('Unknown compression {0!r}, expected one of {1}'.format(compression, ', '.join(COMPRESSIONS)))
+    target = path + COMPRESSIONS[compression]
+    if compression == 'zip':
+        import zipfile
+
+        with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED, compresslevel=level) as archive:
+            # force_zip64, as the size is not known before the entry is written.
+            with archive.open(entry or os.path.basename(path), 'w', force_zip64=True) as stream:
+                if blocksize is not None:
+                    output_file = BlockFile(io.BufferedWriter(stream, 1 << 16))
+                else:
+                    output_file = io.TextIOWrapper(io.BufferedWriter(stream, 1 << 16), encoding='utf-8')
+                yield output_file
+                output_file.close()
+        return
+    if blocksize is not None:
+        compress = None if compression == 'none' else block_compressor(compression, level)
+        output_file = BlockFile(open(target, 'wb'), compress, blocksize)
+        try:
+            yield output_file
+        finally:
+            output_file.close()
+        return
+    if compression == 'none':
+        with open(target, 'w', encoding='utf-8') as output_file:
+            yield output_file
+        return
+    if compression == 'gzip':
+        import gzip
+
+        stream = gzip.open(target, 'wb', compresslevel=9 if level is None else level)
+    else:
+        stream = _zstd_open(target, level)
+    output_file = io.TextIOWrapper(io.BufferedWriter(stream, 1 << 16), encoding='utf-8')
+    try:
+        yield output_file
+    finally:
+        output_file.close()
+
+
+class ActivityWriter:
+    """
+    Write iati-activities to a file one activity at a time.
+    Only the activity being written is held in memory.
+    """
+
+    def __init__(self, output_file, tag, attrib):
+        """
+        :param output_file: A text file opened for writing.
+        :param tag: The root element name.
+        :param attrib: Dictionary of root attributes.
+        """
+        self.output_file = output_file
+        self.tag = tag
+        self.output_file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        self.output_file.write(start_tag(tag, attrib) + '\n')
+
+    def write(self, activity):
+        """
+        Serialize an activity and write it out.
+        :param activity: The iati-activity element. It is no longer needed after this call.
+        """
+        self.write_fragment(serialize_activity(activity))
+
+    def write_fragment(self, fragment):
+        """
+        Write activities that were already serialized, see serialize_activity.
+        :param fragment: The serialized activities.
+        :return location: Where the fragment was written when the output is a BlockFile, see BlockFile.write.
+        """
+        return self.output_file.write(fragment)
+
+    def close(self):
+        """
+        Close the root element.
+        """
+        self.output_file.write('</{0}>\n'.format(self.tag))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
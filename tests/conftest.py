@@ -0,0 +1,55 @@
+import pandas
+import pytest
+
+from crs_to_xml.grouping import group_split
+from crs_to_xml.normalize import normalize
+
+
+def crs_table(ids, **columns):
+    """
+    Return a small CRS table with a row per id, the columns every activity needs and the columns given.
+    :param ids: The crs_id_number of each row.
+    :param columns: Extra columns, each a list with a value per row.
+    :return crs: The DataFrame.
+    """
+    rows = len(ids)
+    crs = pandas.DataFrame({
+        'crs_id_number': [str(crsid) for crsid in ids],
+        'project_title': ['Project {0}'.format(crsid) for crsid in ids],
+        'recipient_country': ['Kenya'] * rows,
+        'purpose_code': [11220] * rows,
+        'reporting_year': [2016] * rows,
+        'amt_extended': [100.0 + row for row in range(rows)],
+        'flow_type': [11] * rows,
+    })
+    for name, values in columns.items():
+        crs[name] = values
+    return crs
+
+
+def chunked(crs, size):
+    """
+    :param crs: The crs DataFrame.
+    :param size: Rows per chunk.
+    :return chunks: The normalized columns of consecutive slices, as the readers give them.
+    """
+    return [normalize(crs.iloc[start:start + size]) for start in range(0, len(crs), size)]
+
+
+def materialize(activities):
+    """
+    :param activities: Tuples of activity id, columns and row positions, see grouping.stream_activities.
+    :return activities: List of the activity id and the values of its rows, column by column.
+    """
+    return [(activityid, {name: [values[row] for row in activityRows] for name, values in crscolumns.items()})
+            for activityid, crscolumns, activityRows in activities]
+
+
+@pytest.fixture
+def scattered():
+    """
+    A table whose activities have their rows spread over the whole file, with its grouping.
+    """
+    ids = [1, 2, 3, 1, 4, 2, 5, 1, 3, 6, 2, 7, 1, 8, 5, 9, 3, 1, 10, 2]
+    crs = crs_table(ids)
+    return crs, group_split(crs['crs_id_number'].tolist())
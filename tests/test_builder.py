@@ -0,0 +1,26 @@
+from conftest import crs_table
+
+from crs_to_xml.builder import build_activity
+from crs_to_xml.normalize import normalize
+
+
+def other_amounts(**columns):
+    """
+    Build a single-row activity with other-flags and the columns given.
+    :return amounts: Dictionary of dac:other-amounts code to the text of its dac:value.
+    """
+    crscolumns = normalize(crs_table([1], FTC=[1], commitment_date=['2016-05-01'], **columns))
+    crscolumns['recipient_code'] = ['KE']
+    activity = build_activity(crscolumns, '1', [0], '2017-01-01T00:00:00.000Z')
+    return {element.get('code'): element.find('dac:value').text
+            for element in activity.find('crs-add').findall('dac:other-amounts')}
+
+
+def test_export_credit_without_expert_commitment():
+    # export_credit has an element of its own, also when there is no expert commitment to attach it to.
+    assert other_amounts(export_credit=[1250.5]) == {'4': '1250.5'}
+
+
+def test_other_amounts_each_get_their_code():
+    amounts = other_amounts(irtc=[1.0], expert_commitment=[2.0], expert_extended=[3.0], export_credit=[4.0])
+    assert amounts == {'1': '1.0', '2': '2.0', '3': '3.0', '4': '4.0'}
@@ -0,0 +1,11 @@
+from crs_to_xml import cache
+
+
+def test_cache_key_follows_reader_code(tmp_path, monkeypatch):
+    source = tmp_path / 'crs.csv'
+    source.write_text('crs_id_number\n1\n', encoding='utf-8')
+    key = cache.cache_key(str(source), '1')
+    assert cache.cache_key(str(source), '1') == key
+    assert cache.cache_key(str(source), '2') != key
+    monkeypatch.setattr(cache, 'READER_MODULES', cache.READER_MODULES[:-1])
+    assert cache.cache_key(str(source), '1') != key
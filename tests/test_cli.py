@@ -0,0 +1,12 @@
+from conftest import crs_table
+
+from crs_to_xml.cli import main
+
+
+def test_instruments_are_reported_without_report_file(tmp_path, capsys):
+    source = str(tmp_path / 'crs.csv')
+    crs_table([1, 2, 1]).to_csv(source, index=False)
+    main([source, '--output', str(tmp_path / 'export'), '--trace-memory'])
+    output = capsys.readouterr().out
+    assert 'activities emitted: 2' in output
+    assert 'peak traced memory: ' in output
@@ -0,0 +1,24 @@
+from xml.etree import ElementTree
+
+import pytest
+
+from conftest import crs_table
+
+from crs_to_xml.convert import convert
+from crs_to_xml.reverse import open_document
+
+
+def test_country_alias_table_option(tmp_path):
+    aliases = tmp_path / 'aliases.csv'
+    aliases.write_text('name,code\nKenia,KE\n', encoding='utf-8')
+    source = str(tmp_path / 'crs.csv')
+    crs_table([1, 2], recipient_country=['Kenia', 'Kenya']).to_csv(source, index=False)
+
+    summary = convert(source, str(tmp_path / 'export'), {'compression': 'none', 'country_aliases': str(aliases)})
+    with open_document(summary['output']) as document:
+        codes = [activity.find('transaction/recipient-country').get('code')
+                 for activity in ElementTree.parse(document).getroot()]
+    assert codes == ['KE', 'KE']
+
+    with pytest.raises(FileNotFoundError):
+        convert(source, str(tmp_path / 'export'), {'country_aliases': str(tmp_path / 'missing.csv')})
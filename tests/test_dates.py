@@ -0,0 +1,33 @@
+from xml.etree import ElementTree
+
+import pandas
+
+from conftest import crs_table
+
+from crs_to_xml.convert import convert
+from crs_to_xml.normalize import date_column, normalize
+from crs_to_xml.reverse import open_document
+
+
+def test_years_are_not_read_as_serials():
+    column = date_column(pandas.Series([2017, '2017', 2017.0, 43000, '43000', None, '2017-03-04']))
+    assert column == ['2017-01-01', '2017-01-01', '2017-01-01', '2017-09-22', '2017-09-22', None, '2017-03-04']
+
+
+def test_transaction_dates_fall_back_to_commitment_date():
+    crscolumns = normalize(crs_table([1, 1, 1], reporting_year=[2016, None, None],
+                                     commitment_date=[None, '2015-05-06', None]))
+    assert crscolumns['transaction_date'] == ['2016-01-01', '2015-05-06', None]
+    assert crscolumns['value_date'] == ['2016-01-01', '2015-05-06', None]
+
+
+def test_undated_transactions_are_left_undated_and_counted(tmp_path):
+    source = str(tmp_path / 'crs.csv')
+    crs_table([1, 2, 2], reporting_year=[2016, None, 2016]).to_csv(source, index=False)
+    summary = convert(source, str(tmp_path / 'export'), {'compression': 'none'})
+    assert summary['undated transactions'] == 1
+    with open_document(summary['output']) as document:
+        transactions = [transaction for activity in ElementTree.parse(document).getroot()
+                        for transaction in activity.iter('transaction')]
+    assert [transaction.find('transaction-date') is not None for transaction in transactions] == [True, False, True]
+    assert transactions[1].find('value').get('value-date') is None
@@ -0,0 +1,38 @@
+from conftest import chunked, crs_table, materialize
+
+from crs_to_xml.grouping import activity_groups, group_split, stream_activities
+
+
+def test_activities_in_order_of_first_appearance():
+    grouping = group_split(['30', '10', '20', '10', '30'])
+    assert grouping.ids.tolist() == ['30', '10', '20']
+    assert list(activity_groups(grouping)) == [('30', [0, 4]), ('10', [1, 3]), ('20', [2])]
+
+
+def test_ids_are_stripped_to_their_digits():
+    grouping = group_split([' 12', '12 ', '12\t', '1 2', 12, 'CRS-7', '7'])
+    assert list(activity_groups(grouping)) == [('12', [0, 1, 2, 3, 4]), ('7', [5, 6])]
+
+
+def test_scattered_rows_are_gathered(scattered):
+    crs, grouping = scattered
+    expected = {}
+    for row, crsid in enumerate(crs['crs_id_number']):
+        expected.setdefault(crsid, []).append(row)
+    assert list(activity_groups(grouping)) == list(expected.items())
+
+    # Chunk sizes that split activities over several chunks, or keep them in one, give the same activities.
+    whole = materialize(stream_activities(grouping, chunked(crs, len(crs))))
+    assert [activityid for activityid, columns in whole] == list(expected)
+    assert whole[0][1]['transaction_amount'] == ['100.00', '103.00', '107.00', '112.00', '117.00']
+    for size in [1, 3, 7]:
+        assert materialize(stream_activities(grouping, chunked(crs, size))) == whole
+
+
+def test_activity_is_yielded_once_its_last_row_is_read():
+    crs = crs_table([1, 2, 1, 3])
+    grouping = group_split(crs['crs_id_number'].tolist())
+    activities = stream_activities(grouping, iter(chunked(crs, 2)))
+    # 1 ends in the second chunk, so 2 cannot be yielded before it.
+    assert next(activities)[0] == '1'
+    assert [activityid for activityid, columns, rows in activities] == ['2', '3']
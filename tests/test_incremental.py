@@ -0,0 +1,113 @@
+import os
+import re
+
+import pytest
+
+from conftest import chunked, crs_table
+
+from crs_to_xml import incremental
+from crs_to_xml.convert import convert
+from crs_to_xml.grouping import stream_activities
+from crs_to_xml.incremental import FingerprintStore, reuse_fragments
+from crs_to_xml.merge import Merger
+from crs_to_xml.reverse import open_document
+from crs_to_xml.spill import spill_activities
+
+
+def run(storedir, activities, version='1'):
+    """
+    Convert activities through a store and commit it.
+    :param activities: List of (activity id, content); the content is the whole source of the activity.
+    :return store, fragments, built: The store, the fragments in order and the ids that were built.
+    """
+    store = FingerprintStore(str(storedir), version)
+    built = []
+
+    def build(todo):
+        for activityid, crscolumns, activityRows in todo:
+            built.append(activityid)
+            yield '<a id="{0}">{1}</a>'.format(activityid, crscolumns['content'][activityRows[0]])
+
+    fragments = list(reuse_fragments(((activityid, {'content': [content]}, [0]) for activityid, content in activities),
+                                     store, build))
+    store.commit()
+    return store, fragments, built
+
+
+def test_unchanged_activities_are_reused(tmp_path):
+    first = [('1', 'a'), ('2', 'b'), ('3', 'c')]
+    store, fragments, built = run(tmp_path, first)
+    assert built == ['1', '2', '3'] and store.added == ['1', '2', '3']
+
+    store, again, built = run(tmp_path, [('1', 'a'), ('2', 'B'), ('4', 'd')])
+    assert built == ['2', '4']
+    assert store.changed == ['2'] and store.added == ['4'] and store.removed() == ['3']
+    # Reused and built fragments come out in input order.
+    assert again == ['<a id="1">a</a>', '<a id="2">B</a>', '<a id="4">d</a>']
+
+
+def test_other_version_rebuilds(tmp_path):
+    run(tmp_path, [('1', 'a')])
+    store, fragments, built = run(tmp_path, [('1', 'a')], version='2')
+    assert built == ['1'] and not store.reusable
+
+
+def test_store_version_follows_builder_code():
+    version = incremental.store_version('0.1')
+    assert version.startswith('0.1-{0}-'.format(incremental.STORE_FORMAT))
+    assert version == incremental.store_version('0.1')
+
+
+def test_interrupted_commit_keeps_previous_store(tmp_path, monkeypatch):
+    run(tmp_path, [('1', 'a'), ('2', 'b')])
+    replace = os.replace
+
+    def interrupted(source, target):
+        if os.path.basename(target) == 'manifest.json':
+            raise KeyboardInterrupt
+        replace(source, target)
+
+    monkeypatch.setattr(os, 'replace', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        run(tmp_path, [('2', 'B'), ('1', 'A'), ('3', 'c')])
+    monkeypatch.undo()
+
+    # The next run still finds the first run's fragments, at the offsets they were written at.
+    store, fragments, built = run(tmp_path, [('1', 'a'), ('2', 'b')])
+    assert built == []
+    assert fragments == ['<a id="1">a</a>', '<a id="2">b</a>']
+    # The unfinished generation is removed once a run commits.
+    assert [name for name in os.listdir(str(tmp_path)) if not name.startswith('manifest')] == \
+        [os.path.basename(store.staging)]
+
+
+def test_incremental_conversion_matches_full(tmp_path):
+    crs = crs_table([1, 2, 1, 3])
+    source = str(tmp_path / 'crs.csv')
+    crs.to_csv(source, index=False)
+    options = {'compression': 'none', 'incremental': str(tmp_path / 'store')}
+    convert(source, str(tmp_path / 'first'), options)
+    crs.loc[3, 'project_title'] = 'Changed'
+    crs.to_csv(source, index=False)
+    summary = convert(source, str(tmp_path / 'second'), options)
+    assert summary['incremental'] == {'added': [], 'changed': ['3'], 'removed': []}
+    full = convert(source, str(tmp_path / 'full'), {'compression': 'none'})
+
+    def document(path):
+        with open_document(path) as stream:
+            # Timestamps differ between runs and reused activities keep the time they were built at.
+            return re.sub(rb'datetime="[^"]*"', b'', stream.read())
+
+    assert document(summary['output']) == document(full['output'])
+
+
+def test_fingerprints_do_not_depend_on_how_rows_are_gathered(scattered, tmp_path):
+    crs, grouping = scattered
+    streamed = [(activityid, incremental.fingerprint(crscolumns, activityRows))
+                for activityid, crscolumns, activityRows in stream_activities(grouping, chunked(crs, len(crs)))]
+    # Spilled rows are read back from run files, so equal values are no longer one shared object.
+    spilled = spill_activities(grouping, chunked(crs, 4), 1, str(tmp_path))
+    merger = Merger(['a.csv', 'b.csv'], [0, 10, len(crs)], grouping, 'union')
+    merged = [(activityid, incremental.fingerprint(crscolumns, activityRows))
+              for activityid, crscolumns, activityRows in merger.merge(spilled)]
+    assert merged == streamed
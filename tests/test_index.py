@@ -0,0 +1,45 @@
+import glob
+import os
+from xml.etree import ElementTree
+
+import pytest
+
+from conftest import crs_table
+
+from crs_to_xml.convert import convert
+from crs_to_xml.index import ActivityIndex
+from crs_to_xml.reverse import open_document
+
+
+def text(activity):
+    """
+    :return text: The serialized activity, without the whitespace that follows it in the document.
+    """
+    activity.tail = None
+    return ElementTree.tostring(activity)
+
+
+@pytest.fixture
+def source(tmp_path):
+    ids = [5, 6, 5, 7, 8, 6, 9]
+    crs = crs_table(ids, recipient_country=['Kenya', 'Peru', 'Kenya', 'Kenya', 'Nepal', 'Peru', 'Peru'])
+    path = str(tmp_path / 'crs.csv')
+    crs.to_csv(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize('compression', ['none', 'gzip', 'zip'])
+def test_index_reads_back_every_activity(source, tmp_path, compression):
+    summary = convert(source, str(tmp_path / 'export'), {'index': True, 'compression': compression,
+                                                         'block_size': 256})
+    with open_document(summary['output']) as document:
+        activities = {activity.find('other-identifier').get('ref'): text(activity)
+                      for activity in ElementTree.parse(document).getroot()}
+    indexpath, = glob.glob(os.path.join(str(tmp_path / 'export'), '*', '*-index.tsv'))
+    index = ActivityIndex(indexpath)
+    assert len(index) == len(activities) == 5
+    for activityid, activity in activities.items():
+        assert activityid in index
+        assert text(index.get(activityid)) == activity
+    assert index.select(recipient_country='PE') == ['6', '9']
+    assert len(index.select(reporting_year=2016)) == 5
@@ -0,0 +1,69 @@
+import pandas
+import pytest
+
+from conftest import crs_table, materialize
+
+from crs_to_xml.grouping import group_split, stream_activities
+from crs_to_xml.merge import Merger
+from crs_to_xml.normalize import normalize
+
+
+@pytest.fixture
+def files():
+    """
+    Two files: 1 is in both, with its first row repeated in the second file and a new title there,
+    2 is only in the first file and 3 only in the second.
+    """
+    first = crs_table([1, 2, 1], amt_extended=[10.0, 20.0, 30.0])
+    second = crs_table([3, 1, 1], amt_extended=[40.0, 10.0, 50.0])
+    second.loc[2, 'project_title'] = 'Project 1, amended'
+    return first, second
+
+
+def merged(files, policy):
+    """
+    :return merger, activities: The Merger and the merged activities, materialized.
+    """
+    crs = pandas.concat(files, ignore_index=True)
+    grouping = group_split(crs['crs_id_number'].tolist())
+    fileoffsets = [0, len(files[0]), len(crs)]
+    merger = Merger(['a.csv', 'b.csv'], fileoffsets, grouping, policy)
+    activities = materialize(merger.merge(stream_activities(grouping, [normalize(crs)])))
+    return merger, dict(activities)
+
+
+def test_latest_keeps_rows_of_last_file(files):
+    merger, activities = merged(files, 'latest')
+    assert activities['1']['transaction_amount'] == ['10.00', '50.00']
+    assert activities['1']['project_title'] == ['Project 1', 'Project 1, amended']
+    assert activities['2']['transaction_amount'] == ['20.00']
+    assert activities['3']['transaction_amount'] == ['40.00']
+    assert merger.dropped == 2
+    # The rows kept, as positions in the concatenated source.
+    assert list(merger.keptrows.values()) == [[4, 5]]
+
+
+def test_union_drops_rows_repeated_from_earlier_file(files):
+    merger, activities = merged(files, 'union')
+    assert activities['1']['transaction_amount'] == ['10.00', '30.00', '50.00']
+    assert merger.dropped == 1
+    assert list(merger.keptrows.values()) == [[0, 2, 5]]
+
+
+def test_conflicts_are_reported(files, tmp_path):
+    merger, activities = merged(files, 'latest')
+    assert merger.conflicting() == 0
+    # Files disagree when the first rows they have for an activity differ.
+    first, second = files
+    second.loc[1, 'project_title'] = 'Renamed'
+    merger, activities = merged((first, second), 'latest')
+    assert merger.conflicting() == 1
+    merger.write_report(str(tmp_path / 'merge.tsv'))
+    lines = (tmp_path / 'merge.tsv').read_text(encoding='utf-8').splitlines()
+    assert lines[1].split('\t')[0] == '1'
+    assert 'project_title' in lines[1]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Merger(['a.csv'], [0, 1], group_split(['1']), 'newest')
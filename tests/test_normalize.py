@@ -0,0 +1,26 @@
+import numpy
+import pandas
+
+from conftest import crs_table
+
+from crs_to_xml.normalize import CHAINS, coalesce_column, normalize
+
+
+def test_empty_cells_fall_through_the_chain():
+    crs = pandas.DataFrame({
+        'amt_extended': [numpy.nan, '', None, ' ', 0.0],
+        'commitments': [2.5, '', numpy.nan, 'n/a', 7.0],
+        'amt_received': [9.0, '3', numpy.nan, numpy.nan, 8.0],
+    })
+    amounts, codes = coalesce_column(crs, CHAINS['transaction'])
+    # interest_received is not in the table and is skipped. A zero is a value and ends the chain.
+    assert amounts == ['2.50', '3.00', None, None, '0.00']
+    assert codes == ['2', '6', None, None, '3']
+
+
+def test_empty_chain_gives_none():
+    crscolumns = normalize(crs_table([1, 2], amt_extended=[numpy.nan, ''], amt_untied=[None, numpy.nan]))
+    assert crscolumns['transaction_amount'] == [None, None]
+    assert crscolumns['transaction_code'] == [None, None]
+    assert crscolumns['tied_amount'] == [None, None]
+    assert crscolumns['tied_code'] == [None, None]
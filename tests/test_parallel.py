@@ -0,0 +1,32 @@
+import datetime
+import functools
+import sys
+import types
+
+from crs_to_xml import parallel
+from crs_to_xml.convert import convert
+from crs_to_xml.reverse import open_document
+
+
+class PinnedDatetime(datetime.datetime):
+    @classmethod
+    def utcnow(cls):
+        return cls(2017, 1, 2, 3, 4, 5, 678000)
+
+
+def test_workers_give_the_same_bytes(scattered, tmp_path, monkeypatch):
+    # The package exports the convert function under the module's name.
+    monkeypatch.setattr(sys.modules['crs_to_xml.convert'], 'datetime', types.SimpleNamespace(datetime=PinnedDatetime))
+    # Small batches, so several tasks are in flight at once and may finish out of order.
+    monkeypatch.setattr(parallel, 'make_batches', functools.partial(parallel.make_batches, batchrows=3))
+    crs, grouping = scattered
+    source = str(tmp_path / 'crs.csv')
+    crs.to_csv(source, index=False)
+
+    documents = []
+    for workers in [1, 2]:
+        summary = convert(source, str(tmp_path / str(workers)), {'compression': 'none', 'workers': workers})
+        with open_document(summary['output']) as document:
+            documents.append(document.read())
+    assert b'2017-01-02T03:04:05.678Z' in documents[0]
+    assert documents[0] == documents[1]
@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import chunked, materialize
+
+from crs_to_xml.grouping import stream_activities
+from crs_to_xml.spill import plan_partitions, row_size, spill_activities
+
+
+def test_plan_partitions_covers_every_activity(scattered):
+    crs, grouping = scattered
+    bounds = plan_partitions(grouping, 3)
+    assert bounds[0] == 0 and bounds[-1] == len(grouping.ids)
+    assert all(start < end for start, end in zip(bounds, bounds[1:]))
+    counts = grouping.offsets[1:] - grouping.offsets[:-1]
+    for start, end in zip(bounds, bounds[1:]):
+        # Only an activity with more rows than a partition holds gets a partition over the limit.
+        assert counts[start:end].sum() <= 3 or end - start == 1
+
+
+@pytest.mark.parametrize('rows', [1, 3, 7, 1000])
+def test_spilled_activities_equal_streamed(scattered, tmp_path, rows):
+    crs, grouping = scattered
+    expected = materialize(stream_activities(grouping, chunked(crs, 4)))
+    budget = rows * row_size(chunked(crs, 4)[0])
+    spilled = materialize(spill_activities(grouping, chunked(crs, 4), budget, str(tmp_path)))
+    assert spilled == expected
+    # The run files are removed once every activity has been read.
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spill_rejects_short_source(scattered, tmp_path):
+    crs, grouping = scattered
+    with pytest.raises(ValueError):
+        list(spill_activities(grouping, chunked(crs.iloc[:10], 4), 100, str(tmp_path)))
@@ -0,0 +1,20 @@
+from conftest import crs_table
+
+from crs_to_xml.convert import convert
+
+
+def test_activities_are_checked_as_written(tmp_path):
+    source = str(tmp_path / 'crs.csv')
+    crs_table([1, 2, 1], description=['A project'] * 3).to_csv(source, index=False)
+    summary = convert(source, str(tmp_path / 'export'), {'compression': 'none', 'validate': True})
+    validation = summary['validation']
+    assert validation['activities'] == validation['invalid'] == 2
+    errors = validation['errors']
+    # The first error as written, then every placeholder and move needed to check the rest.
+    assert errors["Element 'other-identifier': This element is not expected. Expected is ( iati-identifier )."] == 2
+    assert errors["Element 'title' is written after 'other-identifier'; checked in schema order."] == 2
+    assert errors["Element 'description' is written after 'other-identifier'; checked in schema order."] == 2
+    for name in validation['not written']:
+        assert errors["Missing element '{0}'; checked with a placeholder.".format(name)] == 2
+    # The children after the first error are checked too.
+    assert errors["Element 'default-flow-type': This element is not expected. Expected is ( activity-date )."] == 2